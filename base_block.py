@@ -1,5 +1,10 @@
 #base_block.py
+import itertools
 import tkinter as tk
+from history import moved, change, Rename
+from viewport import unzoom, route, forget_wire
+
+_tags = itertools.count(1)
 
 class DraggableBlock:
     def __init__(self,canvas,x,y):
@@ -9,32 +14,62 @@ class DraggableBlock:
         self.dragging = False
         self.ox = 0
         self.oy = 0
+        # Every canvas item of the block (ports and their labels included)
+        # carries this tag, so moving the block is one canvas.move.
+        self.tag = "blk%d" % next(_tags)
+        self.pdx = 0
+        self.pdy = 0
+        self.redraw_id = None
 
     def on_click(self,event):
         if not self.dragging:
             self.dragging = True
-            self.ox = self.x - event.x
-            self.oy = self.y - event.y
+            # Offsets in model coordinates (the view may be zoomed).
+            self.ox = self.x - unzoom(self.canvas, event.x)
+            self.oy = self.y - unzoom(self.canvas, event.y)
+            self.press_xy = (self.x, self.y)
             self.canvas.bind("<B1-Motion>",self.on_drag)
             self.canvas.bind("<ButtonRelease-1>",self.on_release)
 
     def on_drag(self,event):
         if not self.dragging:
             return
-        nx = event.x + self.ox
-        ny = event.y + self.oy
+        nx = unzoom(self.canvas, event.x) + self.ox
+        ny = unzoom(self.canvas, event.y) + self.oy
         dx = nx - self.x
         dy = ny - self.y
         self.x = nx
         self.y = ny
-        self.move_block(dx,dy)
-        self.move_ports(dx,dy)
-        self.update_connections()
+        # Motion events only add up; the canvas catches up once per frame.
+        self.pdx += dx
+        self.pdy += dy
+        if self.redraw_id is None:
+            self.redraw_id = self.canvas.after_idle(self.redraw)
+
+    def redraw(self):
+        self.redraw_id = None
+        dx, dy = self.pdx, self.pdy
+        self.pdx = self.pdy = 0
+        if dx or dy:
+            self.move_block(dx,dy)
+            self.move_ports(dx,dy)
+            self.update_connections()
 
     def on_release(self,event):
+        if self.redraw_id is not None:
+            self.canvas.after_cancel(self.redraw_id)
+            self.redraw()
         self.dragging = False
         self.canvas.unbind("<B1-Motion>")
         self.canvas.unbind("<ButtonRelease-1>")
+        # One journal entry per drag, not per motion event.
+        dx = self.x - self.press_xy[0]
+        dy = self.y - self.press_xy[1]
+        if dx or dy:
+            moved(self.canvas, self, dx, dy)
+
+    def display_name(self):
+        return self.name
 
     def move_block(self,dx,dy):
         pass
@@ -47,16 +82,17 @@ class DraggableBlock:
 
     def remove_port(self, port):
         cs = self.canvas.data["connections"]
-        for c in cs[:]:
-            if c[0] == port or c[1] == port:
-                self.canvas.delete(c[2])
-                cs.remove(c)
+        for c in list(cs.of_port(port)):
+            self.canvas.delete(c[2])
+            forget_wire(self.canvas, c[2])
+            cs.remove(c)
         self.canvas.delete(port.id)
         self.canvas.delete(port.label_id)
         if port.id in self.canvas.data["port_map"]:
             del self.canvas.data["port_map"][port.id]
         if port.label_id in self.canvas.data["port_map"]:
             del self.canvas.data["port_map"][port.label_id]
+        self.canvas.data["port_index"].remove(port)
 
     def remove_all_connections(self):
         pass
@@ -70,17 +106,10 @@ class DraggableBlock:
         e.pack()
         def ok():
             v = e.get().strip()
-            if v:
-                self.name = v
-                self.canvas.itemconfig(self.text, text=v)
+            if v and v != self.name:
+                change(self.canvas, Rename(self, self.name, v))
             w.destroy()
         tk.Button(w, text="OK", command=ok).pack()
 
     def update_curved_line(self,wire,port1,port2):
-        sx, sy = port1.x, port1.y
-        ex, ey = port2.x, port2.y
-        cx1 = sx + (ex - sx)/2
-        cy1 = sy
-        cx2 = sx + (ex - sx)/2
-        cy2 = ey
-        self.canvas.coords(wire, sx, sy, cx1, cy1, cx2, cy2, ex, ey)
+        route(self.canvas, wire, port1, port2)
@@ -0,0 +1,2 @@
+#bench/__init__.py
+# Scaling benchmarks: `python -m bench --help`.
@@ -0,0 +1,39 @@
+#bench/__main__.py
+import sys
+import json
+import argparse
+from bench.runner import run, compare, load_result
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench",
+                                 description="Time the parser, loader and generator on a synthetic project.")
+    ap.add_argument("--entities", type=int, default=200)
+    ap.add_argument("--ports", type=int, default=32, help="ports per entity")
+    ap.add_argument("--generics", type=int, default=2, help="generics per entity")
+    ap.add_argument("--depth", type=int, default=3, help="ip/ directory depth")
+    ap.add_argument("--pins", type=int, default=2048, help="GPIO pins in DIspx.peri.xml")
+    ap.add_argument("--instances", type=int, default=100, help="blocks in Main.json")
+    ap.add_argument("--connections", type=int, default=400, help="wires in Main.json")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--dir", help="generate the project here instead of a temporary directory")
+    ap.add_argument("-o", "--output", help="write the JSON report to this file")
+    ap.add_argument("--baseline", help="JSON report to compare against; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    a = ap.parse_args(argv)
+    res = run(a.dir, a.repeat, entities=a.entities, ports=a.ports, generics=a.generics,
+              depth=a.depth, pins=a.pins, plls=4, instances=a.instances,
+              connections=a.connections, seed=a.seed)
+    rc = 0
+    if a.baseline:
+        res["regressions"] = compare(res, load_result(a.baseline), a.tolerance)
+        rc = 1 if res["regressions"] else 0
+    text = json.dumps(res, indent=2)
+    if a.output:
+        with open(a.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return rc
+
+if __name__ == "__main__":
+    sys.exit(main())
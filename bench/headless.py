@@ -0,0 +1,199 @@
+#bench/headless.py
+import contextlib
+import types
+from connection_store import ConnectionStore
+from port_index import PortIndex
+
+class HeadlessCanvas:
+    # Enough of tk.Canvas for blocks, ports and wires to be created, moved
+    # and read back without a display. Items keep their coords and tags.
+    def __init__(self):
+        self.items = {}
+        self.tagged = {}
+        self.next_id = 1
+        self.data = {}
+        self.idle = {}
+        self.next_after = 1
+
+    def create(self, kind, args, kw):
+        i = self.next_id
+        self.next_id += 1
+        tags = kw.pop("tags", ())
+        if isinstance(tags, str):
+            tags = (tags,)
+        self.items[i] = {"kind": kind, "coords": [float(a) for a in args], "tags": tuple(tags), "opts": kw}
+        for t in tags:
+            self.tagged.setdefault(t, set()).add(i)
+        return i
+
+    def create_rectangle(self, *args, **kw):
+        return self.create("rectangle", args, kw)
+
+    def create_oval(self, *args, **kw):
+        return self.create("oval", args, kw)
+
+    def create_text(self, *args, **kw):
+        return self.create("text", args, kw)
+
+    def create_line(self, *args, **kw):
+        return self.create("line", args, kw)
+
+    def create_polygon(self, *args, **kw):
+        return self.create("polygon", args, kw)
+
+    def find_withtag(self, tag):
+        if isinstance(tag, int):
+            return (tag,) if tag in self.items else ()
+        if tag == "all":
+            return tuple(self.items)
+        if "&&" not in tag:
+            return tuple(sorted(self.tagged.get(tag, ())))
+        # Tag expressions: only "a&&b&&!c" forms are used.
+        terms = tag.split("&&")
+        first = [t for t in terms if not t.startswith("!")][0]
+        out = []
+        for i in sorted(self.tagged.get(first, ())):
+            ts = self.items[i]["tags"]
+            if all((t[1:] not in ts) if t.startswith("!") else (t in ts) for t in terms):
+                out.append(i)
+        return tuple(out)
+
+    def addtag_withtag(self, new, tag):
+        for i in self.find_withtag(tag):
+            it = self.items[i]
+            if new not in it["tags"]:
+                it["tags"] += (new,)
+                self.tagged.setdefault(new, set()).add(i)
+
+    def dtag(self, tag, old):
+        for i in self.find_withtag(tag):
+            it = self.items[i]
+            it["tags"] = tuple(t for t in it["tags"] if t != old)
+            self.tagged.get(old, set()).discard(i)
+
+    def scale(self, tag, x0, y0, fx, fy):
+        for i in self.find_withtag(tag):
+            c = self.items[i]["coords"]
+            for k in range(0, len(c), 2):
+                c[k] = x0 + (c[k] - x0) * fx
+                c[k+1] = y0 + (c[k+1] - y0) * fy
+
+    def find_overlapping(self, x0, y0, x1, y1):
+        out = []
+        for i, it in self.items.items():
+            c = it["coords"]
+            if c and min(c[0::2]) <= x1 and max(c[0::2]) >= x0 and min(c[1::2]) <= y1 and max(c[1::2]) >= y0:
+                out.append(i)
+        return tuple(out)
+
+    def winfo_width(self):
+        return 1200
+
+    def winfo_height(self):
+        return 800
+
+    def coords(self, item, *args):
+        ids = self.find_withtag(item)
+        if not ids:
+            return []
+        if args:
+            self.items[ids[0]]["coords"] = [float(a) for a in args]
+        return list(self.items[ids[0]]["coords"])
+
+    def move(self, item, dx, dy):
+        for i in self.find_withtag(item):
+            c = self.items[i]["coords"]
+            for k in range(0, len(c), 2):
+                c[k] += dx
+                c[k+1] += dy
+
+    def itemconfig(self, item, **kw):
+        for i in self.find_withtag(item):
+            self.items[i]["opts"].update(kw)
+
+    def gettags(self, item):
+        ids = self.find_withtag(item)
+        return self.items[ids[0]]["tags"] if ids else ()
+
+    def delete(self, item):
+        for i in self.find_withtag(item):
+            for t in self.items.pop(i)["tags"]:
+                self.tagged[t].discard(i)
+
+    def after_idle(self, fn, *args):
+        # Queued until update_idletasks(), like Tk's idle callbacks.
+        k = "after#%d" % self.next_after
+        self.next_after += 1
+        self.idle[k] = (fn, args)
+        return k
+
+    def after_cancel(self, k):
+        self.idle.pop(k, None)
+
+    def update_idletasks(self):
+        while self.idle:
+            k = next(iter(self.idle))
+            fn, args = self.idle.pop(k)
+            fn(*args)
+
+    def tag_bind(self, *args, **kw):
+        pass
+
+    def bind(self, *args, **kw):
+        pass
+
+    def unbind(self, *args, **kw):
+        pass
+
+    def canvasx(self, x):
+        return x
+
+    def canvasy(self, y):
+        return y
+
+class Widget:
+    # Stands in for any Tk widget: every method call is accepted and ignored.
+    def __init__(self, *args, **kw):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kw: None
+
+    def get(self):
+        return ""
+
+def fake_tk():
+    return types.SimpleNamespace(Menu=Widget, Toplevel=Widget, Frame=Widget, Label=Widget,
+                                 Entry=Widget, Button=Widget)
+
+@contextlib.contextmanager
+def headless():
+    # Swaps the tkinter module seen by the block classes for widget stubs
+    # (the canvas itself is passed in explicitly).
+    import base_block
+    import entity_block
+    import port_symbol
+    mods = (base_block, entity_block, port_symbol)
+    saved = [m.tk for m in mods]
+    stub = fake_tk()
+    for m in mods:
+        m.tk = stub
+    try:
+        yield
+    finally:
+        for m, t in zip(mods, saved):
+            m.tk = t
+
+def new_canvas(project_root):
+    c = HeadlessCanvas()
+    c.data = {
+        "connections": ConnectionStore(),
+        "blocks": [],
+        "port_map": {},
+        "block_map": {},
+        "port_index": PortIndex(),
+        "active_line": None,
+        "active_port": None,
+        "project_root": project_root
+    }
+    return c
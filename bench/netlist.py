@@ -0,0 +1,111 @@
+#bench/netlist.py
+import sys
+import json
+import time
+import random
+import argparse
+from collections import defaultdict
+from design_model import Block, Design
+from netlist import Netlist
+
+def legacy_signals(b, c):
+    # The list-membership version generate_top_level used before Netlist,
+    # kept as the reference for timing and for checking equal results.
+    cb = [x for x in b if getattr(x, 'conduit', False)]
+    cp = [y for x in b for y in x.port_symbols if getattr(y, "is_conduit", False)]
+    tin = [pt for xx in cb for pt in xx.port_symbols if pt.port["dir"] in ["in", "inout"]]
+    tout = [pt for xx in cb for pt in xx.port_symbols if pt.port["dir"] in ["out", "inout"]]
+    tin += [pt for pt in cp if pt.port["dir"] in ["in", "inout"]]
+    tout += [pt for pt in cp if pt.port["dir"] in ["out", "inout"]]
+    parent = {}
+    for x_ in b:
+        for y_ in x_.port_symbols:
+            parent[y_] = y_
+
+    def fnd(p):
+        while parent[p] != p:
+            p = parent[p]
+        return p
+
+    for p1, p2 in c:
+        rp = fnd(p1)
+        rq = fnd(p2)
+        if rp != rq:
+            parent[rq] = rp
+    groups = defaultdict(list)
+    for x_ in b:
+        for y_ in x_.port_symbols:
+            groups[fnd(y_)].append(y_)
+    sn = {}
+    sc = 1
+    for v_ in groups.values():
+        i = [x_ for x_ in v_ if x_ in tin]
+        o = [x_ for x_ in v_ if x_ in tout]
+        if (i and o) or not (i or o):
+            s = f"sig{sc}"
+            sc += 1
+        else:
+            s = (i or o)[0].port["name"]
+        for x_ in v_:
+            sn[x_] = s
+    top = set(pt.port["name"] for xx in cb for pt in xx.port_symbols)
+    top.update(pt.port["name"] for pt in cp)
+    types = {}
+    for sg in dict.fromkeys(sn.values()):
+        if sg in top:
+            continue
+        match_ps = [pp for (pp, nm) in sn.items() if nm == sg]
+        types[sg] = match_ps[0].port["type"]
+    return sn, types
+
+def indexed_signals(b, c):
+    nl = Netlist(b, c)
+    sn = {p: n.name for p, n in nl.net_of.items()}
+    return sn, {n.name: n.type for n in nl.internal_nets()}
+
+def make_design(ports, rng):
+    # Blocks of 16 ports, board pins as two conduit blocks, and about one
+    # wire per two ports.
+    blocks = []
+    nb = max(1, ports // 16)
+    for i in range(nb):
+        ps = [{"name": f"p{k}", "dir": "in" if k % 2 else "out", "type": "std_logic"} for k in range(16)]
+        blocks.append(Block(f"blk{i}", 0, 0, [], ps))
+    pins = max(2, ports // 50)
+    blocks.append(Block("BoardInputs", 0, 0, [], [{"name": f"i{k}", "dir": "out", "type": "std_logic"} for k in range(pins)], True))
+    blocks.append(Block("BoardOutputs", 0, 0, [], [{"name": f"o{k}", "dir": "in", "type": "std_logic"} for k in range(pins)], True))
+    outs = [p for x in blocks for p in x.port_symbols if p.port["dir"] == "out"]
+    ins = [p for x in blocks for p in x.port_symbols if p.port["dir"] == "in"]
+    conns = [(rng.choice(outs), rng.choice(ins)) for _ in range(ports // 2)]
+    return Design(blocks, conns)
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    r = fn(*args)
+    return time.perf_counter() - t0, r
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench.netlist",
+                                 description="Signal naming: list-membership passes vs the indexed Netlist.")
+    ap.add_argument("--sizes", default="1000,4000,8000", help="comma separated port counts")
+    ap.add_argument("--indexed-only", default="64000", help="sizes too large to run the old version on")
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args(argv)
+    rng = random.Random(a.seed)
+    rows = []
+    for n, legacy in [(int(s), True) for s in a.sizes.split(",") if s] + \
+                     [(int(s), False) for s in a.indexed_only.split(",") if s]:
+        d = make_design(n, rng)
+        t_new, r_new = timed(indexed_signals, d.blocks, d.connections)
+        row = {"ports": n, "wires": len(d.connections), "indexed_s": round(t_new, 4)}
+        if legacy:
+            t_old, r_old = timed(legacy_signals, d.blocks, d.connections)
+            row["legacy_s"] = round(t_old, 4)
+            row["speedup"] = round(t_old / t_new, 1) if t_new > 0 else None
+            row["same"] = r_old == r_new
+        rows.append(row)
+    print(json.dumps(rows, indent=2))
+    return 0 if all(r.get("same", True) for r in rows) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#bench/runner.py
+import os
+import gc
+import time
+import json
+import tempfile
+import types
+import tracemalloc
+from bench.headless import headless, new_canvas
+from bench.synth import make_project
+
+def measure(fn, repeat):
+    # Best wall time over `repeat` runs, then one traced run for peak memory.
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def stage(name, fn, units, unit, repeat):
+    t, peak = measure(fn, repeat)
+    return {
+        "stage": name,
+        "seconds": round(t, 6),
+        "throughput": round(units / t, 1) if t > 0 else None,
+        "unit": unit + "/s",
+        "peak_kb": peak // 1024
+    }
+
+def run(root=None, repeat=3, **size):
+    # Generates a project (in a temporary directory unless root is given)
+    # and times each stage of the tool against it.
+    from vhdl_parser import find_blocks, parse_peri_xml
+    from gui import load_previous_configuration
+    from generator import generate_top_level
+    from viewport import zoom
+    tmp = None
+    if root is None:
+        tmp = tempfile.TemporaryDirectory(prefix="vsb_bench_")
+        root = tmp.name
+    try:
+        proj = os.path.join(root, "project")
+        out = os.path.join(root, "out")
+        info = make_project(proj, **size)
+        main_json = os.path.join(proj, "Main.json")
+
+        def load():
+            c = new_canvas(out)
+            load_previous_configuration(c, main_json)
+            return c
+
+        def drag(c):
+            # Two frames per block, there and back.
+            ev = types.SimpleNamespace
+            for b in c.data["blocks"]:
+                b.on_click(ev(x=0, y=0))
+                b.on_drag(ev(x=5, y=5))
+                c.update_idletasks()
+                b.on_drag(ev(x=0, y=0))
+                c.update_idletasks()
+                b.on_release(ev(x=0, y=0))
+
+        def zoom_cycle(c):
+            # Out past the level-of-detail threshold and back in.
+            zoom(c, 0.5, 0, 0)
+            zoom(c, 2.0, 0, 0)
+
+        def cold(c):
+            c.data.pop("fragments", None)
+            return c
+
+        with headless():
+            loaded = load()
+            stages = [
+                stage("find_blocks", lambda: find_blocks(proj, use_cache=False), info["files"], "files", repeat),
+                stage("find_blocks_cached", lambda: find_blocks(proj), info["files"], "files", repeat),
+                stage("parse_peri_xml", lambda: parse_peri_xml(proj, use_cache=False), info["pins"], "pins", repeat),
+                stage("load_previous_configuration", load, info["instances"], "blocks", repeat),
+                stage("drag_blocks", lambda: drag(loaded), info["instances"], "blocks", repeat),
+                stage("zoom", lambda: zoom_cycle(loaded), info["instances"], "blocks", repeat),
+                stage("generate_top_level", lambda: generate_top_level(cold(loaded)), info["instances"], "blocks", repeat),
+                stage("generate_top_level_warm", lambda: generate_top_level(loaded), info["instances"], "blocks", repeat)
+            ]
+        return {"project": info, "repeat": repeat, "stages": stages}
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+def compare(result, baseline, tolerance=0.25):
+    # Stages slower (or hungrier) than the baseline by more than tolerance.
+    old = {s["stage"]: s for s in baseline.get("stages", [])}
+    out = []
+    for s in result["stages"]:
+        b = old.get(s["stage"])
+        if b is None:
+            continue
+        for k in ("seconds", "peak_kb"):
+            if b[k] and s[k] > b[k] * (1 + tolerance):
+                out.append({"stage": s["stage"], "metric": k, "baseline": b[k], "current": s[k],
+                            "ratio": round(s[k] / b[k], 2)})
+    return out
+
+def load_result(path):
+    with open(path, "r") as f:
+        return json.load(f)
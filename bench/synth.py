@@ -0,0 +1,145 @@
+#bench/synth.py
+import os
+import json
+import random
+
+def port_types(rng, m):
+    out = []
+    for i in range(m):
+        r = rng.random()
+        if r < 0.5:
+            out.append("std_logic")
+        elif r < 0.9:
+            out.append(f"std_logic_vector({rng.choice((7, 15, 31))} downto 0)")
+        else:
+            out.append(f"unsigned({rng.choice((3, 7))} downto 0)")
+    return out
+
+def entity_source(name, generics, ports):
+    s = [f"library ieee;\nuse ieee.std_logic_1164.all;\nuse ieee.numeric_std.all;\n\nentity {name} is\n"]
+    if generics:
+        s.append("    generic(\n")
+        s.append(";\n".join(f"        {g['name']} : {g['type']} := {g['default']}" for g in generics))
+        s.append("\n    );\n")
+    s.append("    port(\n")
+    for i, p in enumerate(ports):
+        sep = ";" if i < len(ports) - 1 else ""
+        s.append(f"        {p['name']} : {p['dir']} {p['type']}{sep} -- {p['name']}\n")
+    s.append("    );\n")
+    s.append(f"end entity {name};\n\narchitecture rtl of {name} is\n")
+    s.append("    signal r : std_logic;\nbegin\n")
+    s.append("".join(f"    -- stage {i}\n    r <= not r;\n" for i in range(20)))
+    s.append("end architecture rtl;\n")
+    return "".join(s)
+
+def make_entities(rng, n, m, g):
+    ents = []
+    for e in range(n):
+        gens = [{"name": f"G{i}", "type": "integer", "default": str(rng.randint(1, 64))} for i in range(g)]
+        ports = []
+        for i, t in enumerate(port_types(rng, m)):
+            ports.append({"name": f"p{i}", "dir": "in" if i % 2 == 0 else "out", "type": t})
+        ents.append((f"ent{e}", gens, ports))
+    return ents
+
+def write_sources(root, ents, depth):
+    # A third of the entities live at the root, the rest in an ip/ tree
+    # `depth` directories deep.
+    files = []
+    for i, (name, gens, ports) in enumerate(ents):
+        if i % 3 == 0:
+            d = root
+        else:
+            d = os.path.join(root, "ip", *[f"lvl{k}_{i % (k+2)}" for k in range(depth)])
+        os.makedirs(d, exist_ok=True)
+        fp = os.path.join(d, name + ".vhd")
+        with open(fp, "w") as f:
+            f.write(entity_source(name, gens, ports))
+        files.append(fp)
+    return files
+
+def write_peri_xml(root, pins, plls):
+    path = os.path.join(root, "DIspx.peri.xml")
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<efxpt:design_db name="bench" xmlns:efxpt="http://www.efinixinc.com/peri_design_db">\n')
+        f.write('<efxpt:gpio_info>\n')
+        modes = ("input", "output", "inout")
+        for i in range(pins):
+            f.write(f'<efxpt:gpio name="bus{i // 16}[{i % 16}]" mode="{modes[(i // 16) % 3]}" io_standard="3.3_V_LVTTL_/_LVCMOS">'
+                    '<efxpt:input_config name="" conn_type="normal" is_register="false"/></efxpt:gpio>\n')
+        f.write('</efxpt:gpio_info>\n<efxpt:pll_info>\n')
+        for i in range(plls):
+            f.write(f'<efxpt:pll name="pll{i}"><efxpt:output_clock name="clk{i}_0" number="0"/>'
+                    f'<efxpt:output_clock name="clk{i}_1" number="1"/></efxpt:pll>\n')
+        f.write('</efxpt:pll_info>\n</efxpt:design_db>\n')
+    return path
+
+def port_entry(p, x, y, color):
+    d = {"port_name": p["name"], "port_dir": p["dir"], "port_type": p["type"],
+         "x": x, "y": y, "is_conduit": False}
+    if p["dir"] in ["out", "inout"]:
+        d["color"] = color
+    return d
+
+def write_main_json(root, ents, k, c, rng):
+    # k instances on a grid, c wires from an output to a type-compatible
+    # input of another instance. Instances are named uniquely (the saved
+    # connections address ports by block name).
+    blocks = []
+    outs = []
+    ins = {}
+    for i in range(k):
+        name, gens, ports = ents[i % len(ents)]
+        iname = f"{name}_{i}"
+        x = 150 + (i % 20) * 220
+        y = 50 + (i // 20) * 300
+        lc = rc = 0
+        pj = []
+        for p in ports:
+            if p["dir"] == "in":
+                px, py = x - 10, y + 30 + lc*20
+                lc += 1
+                ins.setdefault(p["type"], []).append((iname, p["name"]))
+            else:
+                px, py = x + 110, y + 30 + rc*20
+                rc += 1
+                outs.append((iname, p["name"], p["type"]))
+            pj.append(port_entry(p, px, py, "#1f77b4"))
+        blocks.append({"type": "entity", "name": iname, "x": x, "y": y, "conduit": False,
+                       "generics": gens, "generic_values": {g["name"]: int(g["default"]) for g in gens},
+                       "ports": pj})
+    conns = []
+    for _ in range(c):
+        if not outs:
+            break
+        b1, p1, t = rng.choice(outs)
+        cand = ins.get(t)
+        if not cand:
+            continue
+        b2, p2 = rng.choice(cand)
+        if b2 != b1:
+            conns.append({"block1": b1, "block2": b2, "port1": p1, "port2": p2})
+    path = os.path.join(root, "Main.json")
+    with open(path, "w") as f:
+        json.dump({"blocks": blocks, "connections": conns}, f, indent=2)
+    return path, len(conns)
+
+def make_project(root, entities=200, ports=32, generics=2, depth=3, pins=2048, plls=4,
+                 instances=100, connections=400, seed=1):
+    # Writes a synthetic project under root and returns a summary of it.
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    ents = make_entities(rng, entities, ports, generics)
+    files = write_sources(root, ents, depth)
+    write_peri_xml(root, pins, plls)
+    _, nc = write_main_json(root, ents, instances, connections, rng)
+    return {
+        "files": len(files),
+        "bytes": sum(os.path.getsize(f) for f in files),
+        "entities": entities,
+        "ports": entities*ports,
+        "pins": pins,
+        "instances": instances,
+        "connections": nc
+    }
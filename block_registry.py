@@ -0,0 +1,175 @@
+#block_registry.py
+import os
+
+def same_decl(a, b, keys):
+    for k in keys:
+        x = a.get(k)
+        y = b.get(k)
+        if isinstance(x, str) and isinstance(y, str):
+            x = " ".join(x.lower().split())
+            y = " ".join(y.lower().split())
+        if x != y:
+            return False
+    return True
+
+class BlockEntry:
+    # Merged view of every entity/component declaration sharing one name.
+    # The index only records where each declaration lives (refs); generics
+    # and ports are parsed on the first load() and kept from then on.
+    # The first declaration of a generic or port wins; a later one that
+    # disagrees is recorded in conflicts instead of being silently dropped.
+    def __init__(self, name):
+        self.name = name
+        self.generics = {}
+        self.ports = {}
+        self.generic_origin = {}
+        self.port_origin = {}
+        self.origins = []
+        self.refs = []
+        self.loaded = False
+        self.conflicts = []
+
+    def add_ref(self, path, offset, kind, empty):
+        self.refs.append((path, offset, kind, empty))
+        self.origins.append((path, kind))
+
+    def load(self, loader):
+        if self.loaded:
+            return self
+        for path, offset, kind, _ in self.refs:
+            g, p = loader(path, offset, kind, self.name)
+            self.merge(g, p, path)
+        self.loaded = True
+        return self
+
+    def merge(self, generics, ports, origin):
+        for g in generics:
+            n = g["name"]
+            if n not in self.generics:
+                self.generics[n] = g
+                self.generic_origin[n] = origin
+            elif not same_decl(self.generics[n], g, ("type",)):
+                self.conflict("generic", n, self.generics[n], self.generic_origin[n], g, origin)
+        for p in ports:
+            n = p["name"]
+            if n not in self.ports:
+                self.ports[n] = p
+                self.port_origin[n] = origin
+            elif not same_decl(self.ports[n], p, ("dir", "type")):
+                self.conflict("port", n, self.ports[n], self.port_origin[n], p, origin)
+
+    def conflict(self, what, item, first, first_origin, other, other_origin):
+        self.conflicts.append({
+            "block": self.name,
+            "what": what,
+            "item": item,
+            "first": first,
+            "first_origin": first_origin,
+            "other": other,
+            "other_origin": other_origin
+        })
+
+    def is_empty(self):
+        if not self.loaded:
+            return all(r[3] for r in self.refs)
+        return not self.generics and not self.ports
+
+    def as_tuple(self):
+        return (self.name, list(self.generics.values()), list(self.ports.values()))
+
+class BlockRegistry:
+    # Blocks found in a project, keyed by name. Per-file index results are
+    # kept so a single file can be re-merged without rescanning the rest;
+    # sort_key orders files the way a full scan visits them. loader(path,
+    # offset, kind, name) -> (generics, ports) parses one declaration.
+    def __init__(self, sort_key=None, loader=None):
+        self.files = {}
+        self.entries = {}
+        self.names_by_file = {}
+        self.sort_key = sort_key
+        self.loader = loader
+
+    def add_file(self, path, entities, components):
+        self.files[path] = (entities, components)
+        names = set()
+        for name, off, empty in entities:
+            self.entry(name).add_ref(path, off, "entity", empty)
+            names.add(name)
+        for name, off, empty in components:
+            self.entry(name).add_ref(path, off, "component", empty)
+            names.add(name)
+        self.names_by_file[path] = names
+
+    def update_file(self, path, entities, components):
+        # Returns the names whose merged view may have changed.
+        old = self.names_by_file.get(path, set())
+        self.files[path] = (entities, components)
+        names = {r[0] for r in entities} | {r[0] for r in components}
+        self.names_by_file[path] = names
+        return self.rebuild(old | names)
+
+    def remove_file(self, path):
+        old = self.names_by_file.pop(path, set())
+        self.files.pop(path, None)
+        return self.rebuild(old)
+
+    def rebuild(self, names):
+        # Rebuilt entries start unloaded, so the next load() re-parses them.
+        paths = [p for p in self.files if self.names_by_file[p] & names]
+        if self.sort_key is not None:
+            paths.sort(key=self.sort_key)
+        fresh = {}
+        for p in paths:
+            ents, comps = self.files[p]
+            for kind, decls in (("entity", ents), ("component", comps)):
+                for name, off, empty in decls:
+                    if name in names:
+                        fresh.setdefault(name, BlockEntry(name)).add_ref(p, off, kind, empty)
+        for n in names:
+            if n in fresh:
+                self.entries[n] = fresh[n]
+            else:
+                self.entries.pop(n, None)
+        return names
+
+    def entry(self, name):
+        e = self.entries.get(name)
+        if e is None:
+            e = BlockEntry(name)
+            self.entries[name] = e
+        return e
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def load(self, name):
+        # Parses (once) and returns the named entry, or None.
+        e = self.entries.get(name)
+        if e is None:
+            return None
+        return e.load(self.loader)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def as_list(self):
+        return [e.load(self.loader).as_tuple() for e in self.entries.values()]
+
+    def conflicts(self):
+        # Only entries that were loaded have been compared.
+        return [c for e in self.entries.values() for c in e.conflicts]
+
+def describe_conflict(c, root=None):
+    def rel(p):
+        return os.path.relpath(p, root) if root else p
+    keys = ("dir", "type") if c["what"] == "port" else ("type",)
+    a = " ".join(str(c["first"].get(k)) for k in keys)
+    b = " ".join(str(c["other"].get(k)) for k in keys)
+    return (f"{c['block']}.{c['item']}: {a} ({rel(c['first_origin'])}) "
+            f"vs {b} ({rel(c['other_origin'])})")
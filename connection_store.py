@@ -0,0 +1,81 @@
+#connection_store.py
+
+class ConnectionStore:
+    # The wires on a canvas: (source port, target port, line id, None)
+    # tuples indexed by line id and by port, so a block only ever touches
+    # its own wires. Iterates like the list it replaces, in line id order;
+    # canvas ids only grow, so that is the order the wires were drawn in,
+    # and a wire put back by undo returns to its old place.
+    def __init__(self, connections=()):
+        self.lines = {}
+        self.ports = {}
+        self.last = None
+        self.ordered = True
+        for c in connections:
+            self.append(c)
+
+    def append(self, c):
+        ln = c[2]
+        if self.last is not None and ln < self.last:
+            self.ordered = False
+        else:
+            self.last = ln
+        self.lines[ln] = c
+        for p in c[:2]:
+            s = self.ports.get(p)
+            if s is None:
+                s = self.ports[p] = set()
+            s.add(c)
+
+    add = append
+
+    def remove(self, c):
+        del self.lines[c[2]]
+        for p in c[:2]:
+            s = self.ports[p]
+            s.discard(c)
+            if not s:
+                del self.ports[p]
+
+    def discard(self, c):
+        if c[2] in self.lines:
+            self.remove(c)
+
+    def by_line(self, ln):
+        return self.lines.get(ln)
+
+    def of_port(self, p):
+        return self.ports.get(p, ())
+
+    def of_ports(self, ps):
+        # Wires touching any of ps, each once, in drawing order.
+        out = {}
+        for p in ps:
+            for c in self.ports.get(p, ()):
+                out[c[2]] = c
+        return [out[k] for k in sorted(out)]
+
+    def sort(self):
+        if not self.ordered:
+            self.lines = dict(sorted(self.lines.items()))
+            self.ordered = True
+        if self.lines:
+            self.last = next(reversed(self.lines))
+
+    def index(self, c):
+        self.sort()
+        return list(self.lines).index(c[2])
+
+    def __iter__(self):
+        self.sort()
+        return iter(list(self.lines.values()))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, c):
+        return self.lines.get(c[2]) == c
+
+    def __getitem__(self, i):
+        self.sort()
+        return list(self.lines.values())[i]
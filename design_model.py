@@ -0,0 +1,73 @@
+#design_model.py
+import json
+from utils import port_type
+
+class Port:
+    # GUI-free counterpart of PortSymbol; attribute names match so the
+    # top-level writer accepts either.
+    def __init__(self, block, port, x=0, y=0, is_conduit=False, color=None):
+        self.block = block
+        self.port = port
+        self.ptype = port_type(port["type"])
+        self.x = x
+        self.y = y
+        self.is_conduit = is_conduit
+        self.color = color
+
+class Block:
+    # GUI-free counterpart of EntityBlock.
+    def __init__(self, name, x, y, generics, ports, conduit=False, generic_values=None, subsystem=None):
+        self.name = name
+        self.subsystem = subsystem
+        self.x = x
+        self.y = y
+        self.generics = generics
+        self.conduit = conduit
+        self.generic_values = generic_values or {}
+        self.port_symbols = []
+        for p in ports:
+            if conduit:
+                fd = p["dir"] if p["dir"] in ["in", "out"] else "inout"
+                p = {"name": p["name"], "dir": fd, "type": p["type"]}
+            self.port_symbols.append(Port(self, p))
+
+class Design:
+    def __init__(self, blocks=None, connections=None, routing=None):
+        self.blocks = blocks if blocks is not None else []
+        self.connections = connections if connections is not None else []
+        self.routing = routing
+
+    @classmethod
+    def from_json(cls, data):
+        # Same rules as gui.load_previous_configuration: adapters are
+        # skipped and connections resolve through (block name, port name),
+        # the last block of a given name winning.
+        d = cls(routing=data.get("routing"))
+        for bd in data.get("blocks", []):
+            if bd["type"] != "entity":
+                continue
+            ps = bd.get("ports", [])
+            ep = [{"name": p_["port_name"], "dir": p_["port_dir"], "type": p_["port_type"]} for p_ in ps]
+            b = Block(bd["name"], bd["x"], bd["y"], bd.get("generics", []), ep,
+                      bd.get("conduit", False), bd.get("generic_values"), bd.get("subsystem"))
+            for pps, p_ in zip(b.port_symbols, ps):
+                pps.x = p_["x"]
+                pps.y = p_["y"]
+                pps.is_conduit = p_["is_conduit"]
+                if pps.port["dir"] in ["out", "inout"]:
+                    pps.color = p_.get("color")
+            d.blocks.append(b)
+        pm = {}
+        for b in d.blocks:
+            for ps in b.port_symbols:
+                pm[(b.name, ps.port["name"])] = ps
+        for c_ in data.get("connections", []):
+            k1 = (c_["block1"], c_["port1"])
+            k2 = (c_["block2"], c_["port2"])
+            if k1 in pm and k2 in pm:
+                d.connections.append((pm[k1], pm[k2]))
+        return d
+
+def load_design(path):
+    with open(path, "r") as f:
+        return Design.from_json(json.load(f))
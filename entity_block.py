@@ -1,15 +1,23 @@
 #entity_block.py
+import re
 import tkinter as tk
+import tkinter.messagebox
 from base_block import DraggableBlock
 from port_symbol import PortSymbol
+from top_level import mark_dirty, subsystem_clash
+from viewport import place, move
+from history import delete_block, disconnect_all, change, Generics, Subsystem
 
 class EntityBlock(DraggableBlock):
-    def __init__(self, canvas, x, y, name, generics, ports, conduit=False):
+    def __init__(self, canvas, x, y, name, generics, ports, conduit=False, port_xy=None, generic_values=None):
+        # port_xy: saved (x, y) per port, so a loaded block is created in
+        # place; generic_values: saved values, which skips the prompt.
         super().__init__(canvas, x, y)
         self.name = name
         self.generics = generics
         self.ports = ports
         self.conduit = conduit
+        self.subsystem = None
         lines = [name] + [p["dir"]+" "+p["name"] for p in ports]
         ml = 10
         if lines:
@@ -21,28 +29,21 @@ class EntityBlock(DraggableBlock):
         self.height = max(40+mp*20, 60)
         fc = "lightyellow" if conduit else "lightblue"
         self.obj = self.canvas.create_rectangle(
-            x, y, x+self.width, y+self.height, fill=fc, outline="black"
+            x, y, x+self.width, y+self.height, fill=fc, outline="black", tags=(self.tag, "block")
         )
         self.text = self.canvas.create_text(
-            x+self.width/2, y+10, text=name, font=("Arial",10), anchor="n", fill="black"
+            x+self.width/2, y+10, text=name, font=("Arial",10), anchor="n", fill="black", tags=(self.tag, "block")
         )
-        self.canvas.tag_bind(self.obj, "<Button-3>", self.on_right_click)
-        self.canvas.tag_bind(self.text, "<Button-3>", self.on_right_click)
-        self.canvas.tag_bind(self.obj, "<Button-1>", self.on_click)
-        self.canvas.tag_bind(self.text, "<Button-1>", self.on_click)
-        self.menu = tk.Menu(self.canvas, tearoff=0)
-        self.menu.add_command(label="Delete", command=self.delete_self)
-        if not conduit:
-            self.menu.add_command(label="Rename", command=self.rename_self)
-        if generics:
-            self.menu.add_command(label="Edit Generics", command=self.edit_generics)
-        self.menu.add_separator()
-        self.menu.add_command(label="Remove All Connections", command=self.remove_all_connections)
+        # Events reach the block through the canvas-wide "block" tag
+        # bindings (see gui.bind_items); the menu is built on first use.
+        self.canvas.data["block_map"][self.obj] = self
+        self.canvas.data["block_map"][self.text] = self
+        self.menu = None
         self.port_symbols = []
         lc = 0
         rc = 0
         sy = y + 30
-        for p in ports:
+        for i, p in enumerate(ports):
             if conduit:
                 if p["dir"] == "in":
                     fd = "in"
@@ -59,6 +60,8 @@ class EntityBlock(DraggableBlock):
                     px = x + 30
                     py = sy + lc*20
                     lc += 1
+                if port_xy is not None:
+                    px, py = port_xy[i]
                 ps = PortSymbol(self.canvas, px, py, self, pf, True)
             else:
                 if p["dir"] in ["in","inout"]:
@@ -69,54 +72,95 @@ class EntityBlock(DraggableBlock):
                     px = x + self.width + 10
                     py = sy + rc*20
                     rc += 1
+                if port_xy is not None:
+                    px, py = port_xy[i]
                 ps = PortSymbol(self.canvas, px, py, self, p, False)
 
             self.canvas.data["port_map"][ps.id] = ps
             self.canvas.data["port_map"][ps.label_id] = ps
+            self.canvas.data["port_index"].add(ps)
             self.port_symbols.append(ps)
+        place(self.canvas, self.tag)
 
         self.generic_values = {}
-        if self.generics:
+        if generic_values is not None:
+            self.generic_values = generic_values
+        elif self.generics:
             self.prompt_generics()
 
+    def build_menu(self):
+        m = tk.Menu(self.canvas, tearoff=0)
+        m.add_command(label="Delete", command=self.delete_self)
+        if not self.conduit:
+            m.add_command(label="Rename", command=self.rename_self)
+            m.add_command(label="Subsystem...", command=self.edit_subsystem)
+        if self.generics:
+            m.add_command(label="Edit Generics", command=self.edit_generics)
+        m.add_separator()
+        m.add_command(label="Remove All Connections", command=self.remove_all_connections)
+        return m
+
     def on_right_click(self, event):
+        if self.menu is None:
+            self.menu = self.build_menu()
         self.menu.post(event.x_root, event.y_root)
 
     def delete_self(self):
-        for p in self.port_symbols[:]:
-            self.remove_port(p)
-        self.canvas.delete(self.obj)
-        self.canvas.delete(self.text)
+        # Hidden, not destroyed, until it can no longer be undone.
         if self in self.canvas.data["blocks"]:
-            self.canvas.data["blocks"].remove(self)
+            delete_block(self.canvas, self)
 
     def rename_self(self):
         self.rename_block("Rename Entity")
 
+    def display_name(self):
+        if self.subsystem:
+            return f"{self.name}\n[{self.subsystem}]"
+        return self.name
+
+    def set_subsystem(self, s):
+        self.subsystem = s or None
+        self.canvas.itemconfig(self.text, text=self.display_name())
+        mark_dirty(self.canvas, self)
+
+    def edit_subsystem(self):
+        # Blocks sharing a subsystem name are generated into their own
+        # entity (subsystems/<name>.vhd); an empty name puts it back in Main.
+        w = tk.Toplevel(self.canvas)
+        w.title("Subsystem for "+self.name)
+        tk.Label(w, text="Subsystem (empty = Main):").pack()
+        e = tk.Entry(w)
+        e.insert(0, self.subsystem or "")
+        e.pack()
+        def ok():
+            v = e.get().strip()
+            if v and (not re.match(r"^[A-Za-z]\w*$", v) or v.lower() == "main"):
+                tk.messagebox.showerror("Error", f"'{v}' is not a valid subsystem name.")
+                return
+            clash = subsystem_clash(self.canvas.data["blocks"], v) if v else None
+            if clash:
+                tk.messagebox.showerror("Error", f"Subsystem '{v}' would clash with {clash} in the generated VHDL.")
+                return
+            if (v or None) != self.subsystem:
+                change(self.canvas, Subsystem(self, self.subsystem, v or None))
+            w.destroy()
+        tk.Button(w, text="OK", command=ok).pack()
+
     def move_block(self, dx, dy):
-        self.canvas.move(self.obj, dx, dy)
-        self.canvas.move(self.text, dx, dy)
+        # Moves the port items too (they share the block's tag).
+        move(self.canvas, self.tag, dx, dy)
 
     def move_ports(self, dx, dy):
         for p in self.port_symbols:
             p.x += dx
             p.y += dy
-            self.canvas.move(p.id, dx, dy)
-            self.canvas.move(p.label_id, dx, dy)
 
     def update_connections(self):
-        cd = self.canvas.data["connections"]
-        for c in cd:
-            if c[0] in self.port_symbols or c[1] in self.port_symbols:
-                self.update_curved_line(c[2], c[0], c[1])
+        for c in self.canvas.data["connections"].of_ports(self.port_symbols):
+            self.update_curved_line(c[2], c[0], c[1])
 
     def remove_all_connections(self):
-        cs = []
-        for p in self.port_symbols:
-            cs.extend([c for c in self.canvas.data["connections"] if c[0] == p or c[1] == p])
-        for c_ in cs:
-            self.canvas.delete(c_[2])
-            self.canvas.data["connections"].remove(c_)
+        disconnect_all(self.canvas, self.port_symbols)
 
     def prompt_generics(self):
         w = tk.Toplevel(self.canvas)
@@ -132,6 +176,7 @@ class EntityBlock(DraggableBlock):
                 e.insert(0, g["default"])
             self.generic_entries[g["name"]] = e
         def ok():
+            old = dict(self.generic_values)
             for g in self.generics:
                 n = g["name"]
                 v = self.generic_entries[n].get().strip()
@@ -143,6 +188,7 @@ class EntityBlock(DraggableBlock):
                     if not (v.startswith('"') and v.endswith('"')):
                         v = '"'+v+'"'
                 self.generic_values[n] = v
+            change(self.canvas, Generics(self, old, dict(self.generic_values)))
             w.destroy()
         tk.Button(w, text="OK", command=ok).pack(pady=5)
 
@@ -160,6 +206,7 @@ class EntityBlock(DraggableBlock):
             e.insert(0, str(cv))
             self.generic_entries[g["name"]] = e
         def ok():
+            old = dict(self.generic_values)
             for g in self.generics:
                 n = g["name"]
                 v = self.generic_entries[n].get().strip()
@@ -171,5 +218,6 @@ class EntityBlock(DraggableBlock):
                     if not (v.startswith('"') and v.endswith('"')):
                         v = '"'+v+'"'
                 self.generic_values[n] = v
+            change(self.canvas, Generics(self, old, dict(self.generic_values)))
             w.destroy()
         tk.Button(w, text="OK", command=ok).pack(pady=5)
@@ -0,0 +1,169 @@
+#file_watcher.py
+import os
+import struct
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name.
+EVENT = struct.Struct("iIII")
+
+class Inotify:
+    # Minimal ctypes binding: events only say *that* a VHDL file or the
+    # directory tree changed under a watched directory, the stat diff in
+    # FileWatcher says what.
+    def __init__(self):
+        name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(name, use_errno=True)
+        init = libc.inotify_init1
+        self.add = libc.inotify_add_watch
+        self.rm = libc.inotify_rm_watch
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        # path -> wd and back
+        self.watched = {}
+        self.paths = {}
+        self.dirs_changed = False
+
+    def watch(self, path):
+        if path in self.watched:
+            return
+        wd = self.add(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            # Same directory under a new path (a parent was moved).
+            self.forget(wd)
+            self.watched[path] = wd
+            self.paths[wd] = path
+
+    def forget(self, wd):
+        path = self.paths.pop(wd, None)
+        if path is not None and self.watched.get(path) == wd:
+            del self.watched[path]
+
+    def event(self, wd, mask, name):
+        # True if the event can change the list of VHDL sources or their
+        # contents; directory changes also mean the watches need a sync.
+        if mask & IN_Q_OVERFLOW:
+            # Events were lost; look at everything.
+            self.dirs_changed = True
+            return True
+        if mask & IN_IGNORED:
+            # The watch is gone (directory deleted or unmounted).
+            self.forget(wd)
+            self.dirs_changed = True
+            return True
+        if mask & IN_MOVE_SELF:
+            # The directory now lives elsewhere; a new one at the old path
+            # would otherwise never be watched.
+            self.rm(self.fd, wd)
+            self.forget(wd)
+            self.dirs_changed = True
+            return True
+        if mask & (IN_ISDIR | IN_DELETE_SELF):
+            if mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF):
+                self.dirs_changed = True
+                return True
+            return False
+        lf = name.lower()
+        return lf.endswith(".vhd") or lf.endswith(".vhdl")
+
+    def drain(self):
+        got = False
+        while True:
+            try:
+                b = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                break
+            if not b:
+                break
+            i = 0
+            while i + EVENT.size <= len(b):
+                wd, mask, _, n = EVENT.unpack_from(b, i)
+                i += EVENT.size
+                name = os.fsdecode(b[i:i+n].rstrip(b"\0"))
+                i += n
+                if self.event(wd, mask, name):
+                    got = True
+        return got
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def open_inotify():
+    try:
+        return Inotify()
+    except (OSError, AttributeError, TypeError):
+        return None
+
+class FileWatcher:
+    # Tracks the VHDL sources of a project (same selection as find_blocks).
+    # With inotify, poll() only stats the tree after the kernel reported an
+    # event; without it, every poll() compares a fresh stat snapshot.
+    def __init__(self, root, list_files, use_inotify=True):
+        self.root = root
+        self.list_files = list_files
+        self.state = self.snapshot()
+        self.ino = open_inotify() if use_inotify else None
+        if self.ino is not None:
+            self.sync_watches()
+
+    def snapshot(self):
+        st = {}
+        if not os.path.isdir(self.root):
+            return st
+        for p in self.list_files(self.root):
+            try:
+                s = os.stat(p)
+            except OSError:
+                continue
+            st[p] = (s.st_mtime_ns, s.st_size)
+        return st
+
+    def sync_watches(self):
+        self.ino.dirs_changed = False
+        self.ino.watch(self.root)
+        ipd = os.path.join(self.root, "ip")
+        if os.path.isdir(ipd):
+            for r, dirs, files in os.walk(ipd):
+                self.ino.watch(r)
+
+    def poll(self):
+        if self.ino is not None:
+            if not self.ino.drain():
+                return [], [], []
+            if self.ino.dirs_changed:
+                self.sync_watches()
+        new = self.snapshot()
+        old = self.state
+        added = [p for p in new if p not in old]
+        changed = [p for p in new if p in old and new[p] != old[p]]
+        removed = [p for p in old if p not in new]
+        self.state = new
+        return added, changed, removed
+
+    def uses_inotify(self):
+        return self.ino is not None
+
+    def close(self):
+        if self.ino is not None:
+            self.ino.close()
+            self.ino = None
@@ -1,10 +1,21 @@
 #gui.py
 import tkinter as tk
+import tkinter.messagebox
 import os
 import json
-from vhdl_parser import find_blocks, parse_peri_xml
+import time
+from tkinter import ttk
+from vhdl_parser import build_registry, update_registry, list_vhdl_files, parse_peri_xml
+from block_registry import describe_conflict
+from file_watcher import FileWatcher
 from entity_block import EntityBlock
 from generator import generate_top_level
+from journal import Journal, compact, record
+from history import History, add_block, disconnect, group
+from connection_store import ConnectionStore
+from port_index import PortIndex
+from viewport import wire_coords, to_model, zoom, refresh, route, smooth, set_routing, ZOOM_STEP
+from top_level import saved_blocks
 
 def wire_right_click(e, canvas):
     w = canvas.find_closest(e.x, e.y)[0]
@@ -14,93 +25,176 @@ def wire_right_click(e, canvas):
         m.post(e.x_root, e.y_root)
 
 def disconnect_wire(canvas, w):
-    canvas.delete(w)
-    cs = canvas.data["connections"]
-    r = [x for x in cs if x[2] == w]
-    for x in r:
-        cs.remove(x)
+    x = canvas.data["connections"].by_line(w)
+    if x is not None:
+        disconnect(canvas, x)
 
-def load_previous_configuration(canvas, path):
-    if not os.path.exists(path):
-        return
-    with open(path, "r") as f:
-        data = json.load(f)
-    bdata = data.get("blocks", [])
-    cdata = data.get("connections", [])
-    nb = []
-    for bd in bdata:
-        t = bd["type"]
-        if t == "adapter":
-            continue
-        n = bd["name"]
-        x = bd["x"]
-        y = bd["y"]
-        if t == "entity":
-            g = bd.get("generics", [])
-            ps = bd.get("ports", [])
-            ep = []
-            for p_ in ps:
-                ep.append({
-                    "name": p_["port_name"],
-                    "dir":  p_["port_dir"],
-                    "type": p_["port_type"]
-                })
-            e = EntityBlock(canvas, x, y, n, g, ep, bd.get("conduit", False))
-            e.name = n
-            e.x = x
-            e.y = y
-            if bd.get("generic_values"):
-                e.generic_values = bd["generic_values"]
-            co = canvas.coords(e.obj)
-            dx = x - co[0]
-            dy = y - co[1]
-            canvas.move(e.obj, dx, dy)
-            canvas.move(e.text, dx, dy)
-            for i, pps in enumerate(e.port_symbols):
-                px = ps[i]["x"]
-                py = ps[i]["y"]
-                pdx = px - pps.x
-                pdy = py - pps.y
-                pps.x = px
-                pps.y = py
-                canvas.move(pps.id, pdx, pdy)
-                canvas.move(pps.label_id, pdx, pdy)
-                pps.is_conduit = ps[i]["is_conduit"]
-                if pps.is_conduit:
-                    canvas.itemconfig(pps.id, fill="black", outline="red")
-                else:
-                    if pps.port["dir"] in ["out", "inout"]:
-                        pps.color = ps[i].get("color")
-                        if pps.color:
-                            canvas.itemconfig(pps.id, fill=pps.color, outline=pps.color)
-            nb.append(e)
-    canvas.data["blocks"].extend(nb)
-    pm = {}
-    for x in nb:
-        for ps in x.port_symbols:
-            pm[(x.name, ps.port["name"])] = ps
-    for c_ in cdata:
-        b1 = c_["block1"]
-        b2 = c_["block2"]
-        p1 = c_["port1"]
-        p2 = c_["port2"]
-        if (b1, p1) in pm and (b2, p2) in pm:
-            pp1 = pm[(b1, p1)]
-            pp2 = pm[(b2, p2)]
-            ln = canvas.create_line(
-                pp1.x, pp1.y, pp2.x, pp2.y,
+def item_owner(canvas, key):
+    # The port (key "port_map") or block ("block_map") behind the item
+    # under the pointer.
+    ids = canvas.find_withtag("current")
+    return canvas.data[key].get(ids[0]) if ids else None
+
+def bind_items(canvas):
+    # One set of bindings per item class for the whole canvas, instead of
+    # a set per item; the handlers dispatch to the owning object.
+    def port_press(e):
+        p = item_owner(canvas, "port_map")
+        canvas.data["pressed_port"] = p
+        if p is not None:
+            p.on_press(e)
+
+    def port_motion(e):
+        p = canvas.data.get("pressed_port")
+        if p is not None:
+            p.on_drag(e)
+
+    def port_release(e):
+        p = canvas.data.pop("pressed_port", None)
+        if p is not None:
+            p.on_release(e)
+
+    def port_menu(e):
+        p = item_owner(canvas, "port_map")
+        if p is not None:
+            p.on_port_right_click(e)
+
+    def block_click(e):
+        b = item_owner(canvas, "block_map")
+        if b is not None:
+            b.on_click(e)
+
+    def block_menu(e):
+        b = item_owner(canvas, "block_map")
+        if b is not None:
+            b.on_right_click(e)
+
+    canvas.tag_bind("port", "<ButtonPress-1>", port_press)
+    canvas.tag_bind("port", "<B1-Motion>", port_motion)
+    canvas.tag_bind("port", "<ButtonRelease-1>", port_release)
+    canvas.tag_bind("port", "<Button-3>", port_menu)
+    canvas.tag_bind("block", "<Button-1>", block_click)
+    canvas.tag_bind("block", "<Button-3>", block_menu)
+    canvas.tag_bind("wire", "<Button-3>", lambda e: wire_right_click(e, canvas))
+
+class DesignLoader:
+    # Rebuilds a saved Main.json on the canvas. Every item is created at its
+    # final coordinates; step() does as much as fits in a time budget so
+    # large designs can be streamed in between Tk events.
+    def __init__(self, canvas, data):
+        self.canvas = canvas
+        set_routing(canvas, data.get("routing", "spline"))
+        self.bdata = [bd for bd in data.get("blocks", []) if bd["type"] == "entity"]
+        self.cdata = data.get("connections", [])
+        self.bi = 0
+        self.ci = 0
+        self.nb = []
+        self.pm = None
+
+    def total(self):
+        return len(self.bdata) + len(self.cdata)
+
+    def done_count(self):
+        return self.bi + self.ci
+
+    def add_block(self, bd):
+        ps = bd.get("ports", [])
+        ep = [{"name": p_["port_name"], "dir": p_["port_dir"], "type": p_["port_type"]} for p_ in ps]
+        e = EntityBlock(self.canvas, bd["x"], bd["y"], bd["name"], bd.get("generics", []), ep,
+                        bd.get("conduit", False), [(p_["x"], p_["y"]) for p_ in ps],
+                        bd.get("generic_values") or {})
+        if bd.get("subsystem"):
+            e.set_subsystem(bd["subsystem"])
+        for pps, p_ in zip(e.port_symbols, ps):
+            pps.is_conduit = p_["is_conduit"]
+            if pps.is_conduit:
+                self.canvas.itemconfig(pps.id, fill="black", outline="red")
+            elif pps.port["dir"] in ["out", "inout"]:
+                pps.color = p_.get("color")
+                if pps.color:
+                    self.canvas.itemconfig(pps.id, fill=pps.color, outline=pps.color)
+        self.nb.append(e)
+        self.canvas.data["blocks"].append(e)
+
+    def add_connection(self, c_):
+        k1 = (c_["block1"], c_["port1"])
+        k2 = (c_["block2"], c_["port2"])
+        if k1 in self.pm and k2 in self.pm:
+            pp1 = self.pm[k1]
+            pp2 = self.pm[k2]
+            ln = self.canvas.create_line(
+                *wire_coords(self.canvas, pp1, pp2),
                 fill=pp1.color if pp1.color else "black",
                 tags=("wire",),
-                smooth=True, splinesteps=36, width=3
+                smooth=smooth(self.canvas), splinesteps=36, width=3
             )
-            canvas.data["connections"].append((pp1, pp2, ln, None))
-            cx1 = pp1.x + (pp2.x - pp1.x) / 2
-            cy1 = pp1.y
-            cx2 = pp1.x + (pp2.x - pp1.x) / 2
-            cy2 = pp2.y
-            canvas.coords(ln, pp1.x, pp1.y, cx1, cy1, cx2, cy2, pp2.x, pp2.y)
-    for w in canvas.find_withtag("wire"):
-        canvas.tag_bind(w, "<Button-3>", lambda e: wire_right_click(e, canvas))
+            if not smooth(self.canvas):
+                route(self.canvas, ln, pp1, pp2)
+            self.canvas.data["connections"].append((pp1, pp2, ln, None))
+
+    def step(self, budget=None):
+        # Returns True once everything is loaded; budget is in seconds
+        # (None = no limit).
+        end = None if budget is None else time.perf_counter() + budget
+        while self.bi < len(self.bdata):
+            self.add_block(self.bdata[self.bi])
+            self.bi += 1
+            if end is not None and time.perf_counter() >= end:
+                return False
+        if self.pm is None:
+            # Saved connections name blocks, so the last block of a name wins.
+            self.pm = {}
+            for x in self.nb:
+                for ps in x.port_symbols:
+                    self.pm[(x.name, ps.port["name"])] = ps
+        while self.ci < len(self.cdata):
+            self.add_connection(self.cdata[self.ci])
+            self.ci += 1
+            if end is not None and self.ci % 64 == 0 and time.perf_counter() >= end:
+                return False
+        return True
+
+def read_design(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_previous_configuration(canvas, path):
+    data = read_design(path)
+    if data is not None:
+        DesignLoader(canvas, data).step()
+
+# Time spent loading per event-loop turn while streaming a design in.
+LOAD_SLICE = 0.03
+
+def load_previous_configuration_async(canvas, path, progress=None, done=None, data=None):
+    # Same as load_previous_configuration, in slices scheduled with after()
+    # so the window keeps responding. progress(done, total) is called after
+    # every slice, done() at the end. data, if given, is loaded instead of
+    # the file.
+    if canvas.data.get("loading"):
+        return
+    if data is None:
+        data = read_design(path)
+    if data is None:
+        if done:
+            done()
+        return
+    ld = DesignLoader(canvas, data)
+    canvas.data["loading"] = True
+
+    def tick():
+        finished = ld.step(LOAD_SLICE)
+        if progress:
+            progress(ld.done_count(), ld.total())
+        if finished:
+            canvas.data["loading"] = False
+            if done:
+                done()
+        else:
+            canvas.after(1, tick)
+    tick()
 
 def add_board_io(canvas, input_side, output_side):
     if "board_io_created" in canvas.data and canvas.data["board_io_created"]:
@@ -122,12 +216,25 @@ def add_board_io(canvas, input_side, output_side):
 
     b_in = EntityBlock(canvas, 50, 50, "BoardInputs", [], b_in_ports, conduit=True)
     b_out = EntityBlock(canvas, 250, 50, "BoardOutputs", [], b_out_ports, conduit=True)
-    canvas.data["blocks"].append(b_in)
-    canvas.data["blocks"].append(b_out)
+    with group(canvas):
+        add_block(canvas, b_in)
+        add_block(canvas, b_out)
+
+def palette_label(b):
+    return ("Empty Block: " if b.is_empty() else "Entity/Component: ")+b.name
+
+def report_conflicts(cs, directory):
+    if not cs:
+        return
+    lines = [describe_conflict(c, directory) for c in cs[:15]]
+    if len(cs) > 15:
+        lines.append(f"... and {len(cs) - 15} more")
+    tk.messagebox.showwarning("Conflicting declarations",
+                              "The first declaration is used for:\n\n" + "\n".join(lines))
 
-def run_gui(directory):
-    blocks = find_blocks(directory)
-    in_signals, out_signals = parse_peri_xml(directory)
+def run_gui(directory, peri_path=None):
+    registry = build_registry(directory)
+    in_signals, out_signals = parse_peri_xml(directory, peri_path)
     root = tk.Tk()
     root.title("Efinix System Builder")
     left_frame = tk.Frame(root)
@@ -135,9 +242,33 @@ def run_gui(directory):
     tk.Label(left_frame, text="Available Blocks").pack()
     blocks_listbox = tk.Listbox(left_frame)
     blocks_listbox.pack(fill="both", expand=True)
-    for b in blocks:
-        nm, gen, pts = b
-        blocks_listbox.insert("end",("Empty Block: " if not gen and not pts else "Entity/Component: ")+nm)
+    palette = []
+    for b in registry:
+        palette.append(b.name)
+        blocks_listbox.insert("end", palette_label(b))
+
+    def refresh_palette(names):
+        for n in sorted(names):
+            b = registry.get(n)
+            if n in palette:
+                i = palette.index(n)
+                blocks_listbox.delete(i)
+                if b is None:
+                    palette.pop(i)
+                else:
+                    blocks_listbox.insert(i, palette_label(b))
+            elif b is not None:
+                palette.append(n)
+                blocks_listbox.insert("end", palette_label(b))
+
+    watcher = FileWatcher(directory, list_vhdl_files)
+    watch_ms = 500 if watcher.uses_inotify() else 1500
+
+    def watch_tick():
+        added, changed, removed = watcher.poll()
+        if added or changed or removed:
+            refresh_palette(update_registry(directory, registry, added + changed, removed))
+        root.after(watch_ms, watch_tick)
 
     def add_conduit(root_window, cvs):
         w = tk.Toplevel(root_window)
@@ -182,11 +313,59 @@ def run_gui(directory):
                         final_type = f"{bt}({wd - 1} downto 0)"
             final_dir = "out" if dr=="in" else ("in" if dr=="out" else "inout")
             e = EntityBlock(cvs, 100, 100, nm, [], [{"name": nm, "dir": final_dir,"type": final_type}], True)
-            cvs.data["blocks"].append(e)
+            add_block(cvs, e)
             w.destroy()
         tk.Button(w, text="Create", command=ok).pack()
 
-    load_previous_configuration_button = tk.Button(left_frame, text="Load Existing (if any)", command=lambda: load_previous_configuration(canvas, os.path.join(directory,"Main.json")))
+    load_bar = ttk.Progressbar(left_frame, mode="determinate")
+    load_text = tk.Label(left_frame, text="")
+
+    def load_progress(n, total):
+        if not load_bar.winfo_ismapped():
+            load_text.pack(fill="x")
+            load_bar.pack(fill="x", padx=5)
+        load_bar["maximum"] = max(total, 1)
+        load_bar["value"] = n
+        load_text.config(text=f"Loading design... {n}/{total}")
+
+    def load_done():
+        load_bar.pack_forget()
+        load_text.pack_forget()
+        routing_var.set(canvas.data.get("routing") == "orthogonal")
+
+    main_json = os.path.join(directory, "Main.json")
+
+    def load_design():
+        # Loaded on top of whatever is on the canvas; the journal restarts
+        # from a snapshot of the result.
+        def done():
+            load_done()
+            compact(canvas)
+        load_previous_configuration_async(canvas, main_json, load_progress, done)
+
+    def open_design():
+        # Startup: offer to restore edits an earlier session did not save.
+        jr = Journal(directory)
+        canvas.data["journal"] = jr
+        data = None
+        if jr.pending():
+            if tk.messagebox.askyesno("Recover", "The last session has unsaved changes. Restore them?"):
+                data = jr.recover()
+                if data is None:
+                    tk.messagebox.showwarning("Recover", "Main.json changed since; the unsaved changes cannot be replayed.")
+            if data is None:
+                jr.discard()
+        def done():
+            load_done()
+            # Edits made while loading were not logged; the canvas is then
+            # no longer Main.json and the log starts from a snapshot.
+            if data is not None or jr.missed:
+                compact(canvas)
+            else:
+                jr.start(saved_blocks(canvas.data["blocks"]), "Main.json" if os.path.exists(main_json) else None)
+        load_previous_configuration_async(canvas, main_json, load_progress, done, data)
+
+    load_previous_configuration_button = tk.Button(left_frame, text="Load Existing (if any)", command=load_design)
     load_previous_configuration_button.pack(pady=5, fill="x")
     add_conduit_button = tk.Button(left_frame, text="New Conduit", command=lambda: add_conduit(root, canvas))
     add_conduit_button.pack(pady=5, fill="x")
@@ -194,18 +373,44 @@ def run_gui(directory):
     add_board_io_button.pack(pady=5, fill="x")
     generate_button = tk.Button(left_frame, text="Generate TopLevel", command=lambda: generate_top_level(canvas))
     generate_button.pack(pady=5, fill="x")
+
+    def toggle_routing():
+        # Saved with the design (Main.json "routing").
+        mode = "orthogonal" if routing_var.get() else "spline"
+        set_routing(canvas, mode)
+        record(canvas, "routing", mode=mode)
+
+    routing_var = tk.BooleanVar(root, False)
+    tk.Checkbutton(left_frame, text="Orthogonal wires", variable=routing_var, command=toggle_routing).pack(pady=5, fill="x")
     right_frame = tk.Frame(root)
     right_frame.pack(side="right", expand=True, fill="both")
     canvas = tk.Canvas(right_frame, bg="white")
     canvas.pack(expand=True, fill="both")
     canvas.data = {
-        "connections": [],
+        "connections": ConnectionStore(),
         "blocks": [],
         "port_map": {},
+        "block_map": {},
+        "port_index": PortIndex(),
         "active_line": None,
         "active_port": None,
         "project_root": directory
     }
+    canvas.data["history"] = History(canvas)
+    bind_items(canvas)
+
+    def undo(e=None):
+        # Not while a wire is being drawn or a design is streaming in.
+        if canvas.data["active_line"] is None and not canvas.data.get("loading"):
+            canvas.data["history"].undo()
+
+    def redo(e=None):
+        if canvas.data["active_line"] is None and not canvas.data.get("loading"):
+            canvas.data["history"].redo()
+
+    root.bind("<Control-z>", undo)
+    root.bind("<Control-y>", redo)
+    root.bind("<Control-Shift-Z>", redo)
 
     def start_drag(e):
         s = blocks_listbox.curselection()
@@ -215,9 +420,16 @@ def run_gui(directory):
             block_info = it.split(": ")
             if len(block_info) == 2:
                 bt, bn = block_info
-                selected_block = next((b_ for b_ in blocks if b_[0] == bn), None)
+                selected_block = registry.get(bn)
                 if selected_block:
-                    canvas.data["drag_block"] = selected_block
+                    # Ports are parsed on first use; warn about conflicts once.
+                    fresh = not selected_block.loaded
+                    was_empty = selected_block.is_empty()
+                    registry.load(bn)
+                    if fresh and selected_block.is_empty() != was_empty:
+                        refresh_palette([bn])
+                    canvas.data["drag_block"] = selected_block.as_tuple()
+                    canvas.data["drag_conflicts"] = selected_block.conflicts if fresh else []
                     canvas.data["drag_label"] = tk.Label(left_frame, text=bn, bg="lightgreen")
                     canvas.data["drag_label"].place(x=e.x, y=e.y)
                     blocks_listbox.bind("<Motion>", on_drag_motion)
@@ -240,11 +452,13 @@ def run_gui(directory):
                     if not generics and not ports:
                         tk.messagebox.showinfo("Info", f"Block '{name}' has no generics or ports.")
                     else:
-                        eblock = EntityBlock(canvas, cx, cy, name, generics, ports, conduit=False)
-                        canvas.data["blocks"].append(eblock)
+                        mx, my = to_model(canvas, cx, cy)
+                        eblock = EntityBlock(canvas, mx, my, name, generics, ports, conduit=False)
+                        add_block(canvas, eblock)
             del canvas.data["drag_block"]
             blocks_listbox.unbind("<Motion>")
             blocks_listbox.unbind("<ButtonRelease-1>")
+            report_conflicts(canvas.data.pop("drag_conflicts", []), directory)
 
     blocks_listbox.bind("<Button-1>", start_drag)
 
@@ -253,8 +467,32 @@ def run_gui(directory):
 
     def on_pan_move(event):
         canvas.scan_dragto(event.x, event.y, gain=1)
+        schedule_refresh()
+
+    def schedule_refresh(event=None):
+        # Once per frame, however many pan/resize events arrive.
+        if canvas.data.get("refresh_id") is None:
+            canvas.data["refresh_id"] = canvas.after_idle(run_refresh)
+
+    def run_refresh():
+        canvas.data["refresh_id"] = None
+        refresh(canvas)
+
+    def on_wheel(event):
+        if canvas.data["active_line"] is not None:
+            return
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        zoom(canvas, ZOOM_STEP if up else 1 / ZOOM_STEP, canvas.canvasx(event.x), canvas.canvasy(event.y))
 
     canvas.bind("<ButtonPress-2>", on_pan_start)
     canvas.bind("<B2-Motion>", on_pan_move)
-    load_previous_configuration(canvas, os.path.join(directory, "Main.json"))
+    canvas.bind("<MouseWheel>", on_wheel)
+    canvas.bind("<Button-4>", on_wheel)
+    canvas.bind("<Button-5>", on_wheel)
+    canvas.bind("<Configure>", schedule_refresh)
+    root.after_idle(open_design)
+    root.after(watch_ms, watch_tick)
     root.mainloop()
+    watcher.close()
+    if canvas.data.get("journal"):
+        canvas.data["journal"].close()
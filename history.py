@@ -0,0 +1,314 @@
+#history.py
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from journal import record
+from top_level import mark_dirty
+from viewport import show_labels, forget_wire
+
+# Undo keeps reversible operations, not canvas snapshots: an op holds the
+# objects it touched plus the old/new values, so a step costs the size of
+# the edit. Deleted blocks and wires are hidden rather than destroyed and
+# only really deleted once their op leaves the history.
+HISTORY_LIMIT = 5000
+
+def shift(b, dx, dy):
+    b.x += dx
+    b.y += dy
+    b.move_block(dx, dy)
+    b.move_ports(dx, dy)
+    b.update_connections()
+
+def block_items(b):
+    items = [b.obj, b.text]
+    for p in b.port_symbols:
+        items += [p.id, p.label_id]
+    return items
+
+def destroy(canvas, b):
+    for i in block_items(b):
+        canvas.delete(i)
+    canvas.data["block_map"].pop(b.obj, None)
+    canvas.data["block_map"].pop(b.text, None)
+
+def set_state(canvas, items, state):
+    for i in items:
+        canvas.itemconfig(i, state=state)
+
+class Op:
+    # forward() performs the edit, backward() reverts it; both log to the
+    # journal. discard(done) frees what the op kept alive once it can no
+    # longer be undone (done=True) or redone (done=False).
+    def forward(self, canvas):
+        pass
+
+    def backward(self, canvas):
+        pass
+
+    def discard(self, canvas, done):
+        pass
+
+class Group(Op):
+    def __init__(self, ops):
+        self.ops = ops
+
+    def forward(self, canvas):
+        for o in self.ops:
+            o.forward(canvas)
+
+    def backward(self, canvas):
+        for o in reversed(self.ops):
+            o.backward(canvas)
+
+    def discard(self, canvas, done):
+        for o in self.ops:
+            o.discard(canvas, done)
+
+class Connect(Op):
+    # c is a connection tuple (source port, target port, line id, None).
+    # The store keeps wires in line id order, so a wire put back lands in
+    # its old place; only then is that position looked up, for the journal.
+    def __init__(self, c):
+        self.c = c
+        self.back = False
+
+    def link(self, canvas):
+        sp, tp, ln = self.c[:3]
+        canvas.itemconfig(ln, state="normal")
+        sp.block.update_curved_line(ln, sp, tp)
+        cs = canvas.data["connections"]
+        cs.add(self.c)
+        if self.back:
+            record(canvas, "connect", a=sp, b=tp, at=cs.index(self.c))
+        else:
+            record(canvas, "connect", a=sp, b=tp)
+
+    def unlink(self, canvas):
+        canvas.itemconfig(self.c[2], state="hidden")
+        forget_wire(canvas, self.c[2])
+        canvas.data["connections"].remove(self.c)
+        self.back = True
+        record(canvas, "disconnect", a=self.c[0], b=self.c[1])
+
+    forward = link
+    backward = unlink
+
+    def discard(self, canvas, done):
+        if not done:
+            canvas.delete(self.c[2])
+            forget_wire(canvas, self.c[2])
+
+class Disconnect(Connect):
+    forward = Connect.unlink
+    backward = Connect.link
+
+    def discard(self, canvas, done):
+        if done:
+            canvas.delete(self.c[2])
+            forget_wire(canvas, self.c[2])
+
+class AddBlock(Op):
+    # at: index in canvas.data["blocks"], so an undone delete puts the
+    # block back in its place (and Main.vhd keeps its instance order).
+    def __init__(self, b, at):
+        self.b = b
+        self.at = at
+
+    def show(self, canvas):
+        b = self.b
+        set_state(canvas, block_items(b), "normal")
+        canvas.dtag(b.tag, "deleted")
+        show_labels(canvas, b.tag)
+        pm = canvas.data["port_map"]
+        for p in b.port_symbols:
+            pm[p.id] = p
+            pm[p.label_id] = p
+            canvas.data["port_index"].add(p)
+        canvas.data["blocks"].insert(self.at, b)
+        record(canvas, "add", block=b, at=self.at)
+
+    def hide(self, canvas):
+        b = self.b
+        record(canvas, "delete", block=b)
+        set_state(canvas, block_items(b), "hidden")
+        canvas.addtag_withtag("deleted", b.tag)
+        pm = canvas.data["port_map"]
+        for p in b.port_symbols:
+            pm.pop(p.id, None)
+            pm.pop(p.label_id, None)
+            canvas.data["port_index"].remove(p)
+        canvas.data["blocks"].remove(b)
+
+    forward = show
+    backward = hide
+
+    def discard(self, canvas, done):
+        if not done:
+            destroy(canvas, self.b)
+
+class DeleteBlock(AddBlock):
+    forward = AddBlock.hide
+    backward = AddBlock.show
+
+    def discard(self, canvas, done):
+        if done:
+            destroy(canvas, self.b)
+
+class Move(Op):
+    def __init__(self, b, dx, dy):
+        self.b = b
+        self.dx = dx
+        self.dy = dy
+
+    def forward(self, canvas):
+        shift(self.b, self.dx, self.dy)
+        record(canvas, "move", block=self.b, dx=self.dx, dy=self.dy)
+
+    def backward(self, canvas):
+        shift(self.b, -self.dx, -self.dy)
+        record(canvas, "move", block=self.b, dx=-self.dx, dy=-self.dy)
+
+class Change(Op):
+    # One value of one object going from old to new; apply() sets it.
+    def __init__(self, obj, old, new):
+        self.obj = obj
+        self.old = old
+        self.new = new
+
+    def forward(self, canvas):
+        self.apply(canvas, self.new)
+
+    def backward(self, canvas):
+        self.apply(canvas, self.old)
+
+class Generics(Change):
+    def apply(self, canvas, v):
+        self.obj.generic_values = dict(v)
+        mark_dirty(canvas, self.obj)
+        record(canvas, "generics", block=self.obj, values=dict(v))
+
+class Rename(Change):
+    def apply(self, canvas, v):
+        self.obj.name = v
+        canvas.itemconfig(self.obj.text, text=self.obj.display_name())
+        mark_dirty(canvas, self.obj)
+        record(canvas, "rename", block=self.obj, name=v)
+
+class Subsystem(Change):
+    def apply(self, canvas, v):
+        self.obj.set_subsystem(v)
+        record(canvas, "subsystem", block=self.obj, name=self.obj.subsystem)
+
+class Conduit(Change):
+    def apply(self, canvas, v):
+        p = self.obj
+        p.is_conduit = v
+        canvas.itemconfig(p.id, fill="black", outline="red" if v else "black")
+        record(canvas, "conduit", a=p, on=v)
+
+class History:
+    def __init__(self, canvas, limit=HISTORY_LIMIT):
+        self.canvas = canvas
+        self.limit = limit
+        self.done = deque()
+        self.undone = []
+        self.pending = None
+
+    def push(self, op):
+        if self.pending is not None:
+            self.pending.append(op)
+            return
+        for o in self.undone:
+            o.discard(self.canvas, False)
+        self.undone = []
+        self.done.append(op)
+        if len(self.done) > self.limit:
+            self.done.popleft().discard(self.canvas, True)
+
+    @contextmanager
+    def group(self):
+        # Everything pushed inside is undone/redone as one step; nested
+        # groups fold into the outer one.
+        if self.pending is not None:
+            yield
+            return
+        self.pending = []
+        try:
+            yield
+        finally:
+            ops, self.pending = self.pending, None
+            if len(ops) == 1:
+                self.push(ops[0])
+            elif ops:
+                self.push(Group(ops))
+
+    def undo(self):
+        if not self.done:
+            return False
+        op = self.done.pop()
+        op.backward(self.canvas)
+        self.undone.append(op)
+        return True
+
+    def redo(self):
+        if not self.undone:
+            return False
+        op = self.undone.pop()
+        op.forward(self.canvas)
+        self.done.append(op)
+        return True
+
+    def clear(self):
+        for o in self.done:
+            o.discard(self.canvas, True)
+        for o in self.undone:
+            o.discard(self.canvas, False)
+        self.done.clear()
+        self.undone = []
+
+def history_of(canvas):
+    return canvas.data.get("history")
+
+def push(canvas, op):
+    # Without a history the edit is final straight away.
+    h = history_of(canvas)
+    if h is None:
+        op.discard(canvas, True)
+    else:
+        h.push(op)
+
+def run(canvas, op):
+    op.forward(canvas)
+    push(canvas, op)
+
+def group(canvas):
+    h = history_of(canvas)
+    return h.group() if h is not None else nullcontext()
+
+def connect(canvas, c):
+    run(canvas, Connect(c))
+
+def disconnect(canvas, c):
+    run(canvas, Disconnect(c))
+
+def disconnect_all(canvas, ports):
+    with group(canvas):
+        for c in canvas.data["connections"].of_ports(ports):
+            disconnect(canvas, c)
+
+def add_block(canvas, b):
+    # b was just created on the canvas.
+    run(canvas, AddBlock(b, len(canvas.data["blocks"])))
+
+def delete_block(canvas, b):
+    # The block and its wires go (and come back) in one step.
+    with group(canvas):
+        disconnect_all(canvas, b.port_symbols)
+        run(canvas, DeleteBlock(b, canvas.data["blocks"].index(b)))
+
+def moved(canvas, b, dx, dy):
+    # The drag already moved the block; only log it.
+    record(canvas, "move", block=b, dx=dx, dy=dy)
+    push(canvas, Move(b, dx, dy))
+
+def change(canvas, op):
+    run(canvas, op)
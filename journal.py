@@ -0,0 +1,252 @@
+#journal.py
+import os
+import json
+import hashlib
+from utils import atomic_write
+
+# Append-only edit log kept next to Main.json. The first line names the
+# base document (Main.json, or the last snapshot in Main.autosave.json);
+# every further line is one edit. Blocks are addressed by uid: the base's
+# blocks are numbered in file order, new blocks get the next free number.
+# Ports are addressed by (uid, index in the block's port list).
+JOURNAL_NAME = "Main.journal"
+SNAPSHOT_NAME = "Main.autosave.json"
+# Compact once the log holds this many edits.
+COMPACT_EVERY = 2000
+
+def digest(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def read_lines(path):
+    out = []
+    try:
+        with open(path, "r") as f:
+            for ln in f:
+                try:
+                    out.append(json.loads(ln))
+                except ValueError:
+                    # A torn last line after a crash; everything before it counts.
+                    break
+    except OSError:
+        pass
+    return out
+
+class Replay:
+    # Applies journal edits to a Main.json style document.
+    def __init__(self, doc):
+        self.blocks = {}
+        self.order = []
+        self.conns = []
+        self.routing = doc.get("routing")
+        pm = {}
+        for bd in doc.get("blocks", []):
+            if bd["type"] != "entity":
+                continue
+            u = len(self.order)
+            self.blocks[u] = bd
+            self.order.append(u)
+            for i, p_ in enumerate(bd.get("ports", [])):
+                pm[(bd["name"], p_["port_name"])] = (u, i)
+        for c_ in doc.get("connections", []):
+            k1 = (c_["block1"], c_["port1"])
+            k2 = (c_["block2"], c_["port2"])
+            if k1 in pm and k2 in pm:
+                self.conns.append((pm[k1], pm[k2]))
+
+    def apply(self, e):
+        op = e.get("op")
+        u = e["a"][0] if op == "conduit" else e.get("uid")
+        bd = self.blocks.get(u)
+        if op == "add":
+            self.blocks[u] = e["block"]
+            self.order.insert(e.get("at", len(self.order)), u)
+        elif op == "connect":
+            k = (tuple(e["a"]), tuple(e["b"]))
+            self.conns.insert(e.get("at", len(self.conns)), k)
+        elif op == "disconnect":
+            k = (tuple(e["a"]), tuple(e["b"]))
+            if k in self.conns:
+                self.conns.remove(k)
+        elif op == "routing":
+            self.routing = e["mode"]
+        elif bd is None:
+            return
+        elif op == "move":
+            bd["x"] += e["dx"]
+            bd["y"] += e["dy"]
+            for p_ in bd.get("ports", []):
+                p_["x"] += e["dx"]
+                p_["y"] += e["dy"]
+        elif op == "delete":
+            del self.blocks[u]
+            self.order.remove(u)
+            self.conns = [c for c in self.conns if c[0][0] != u and c[1][0] != u]
+        elif op == "generics":
+            bd["generic_values"] = e["values"]
+        elif op == "rename":
+            bd["name"] = e["name"]
+        elif op == "subsystem":
+            if e["name"]:
+                bd["subsystem"] = e["name"]
+            else:
+                bd.pop("subsystem", None)
+        elif op == "conduit":
+            bd["ports"][e["a"][1]]["is_conduit"] = e["on"]
+
+    def document(self):
+        conns = []
+        for (u1, i1), (u2, i2) in self.conns:
+            b1 = self.blocks[u1]
+            b2 = self.blocks[u2]
+            conns.append({
+                "block1": b1["name"],
+                "block2": b2["name"],
+                "port1": b1["ports"][i1]["port_name"],
+                "port2": b2["ports"][i2]["port_name"]
+            })
+        doc = {"blocks": [self.blocks[u] for u in self.order], "connections": conns}
+        if self.routing and self.routing != "spline":
+            doc["routing"] = self.routing
+        return doc
+
+class Journal:
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, JOURNAL_NAME)
+        self.snapshot = os.path.join(root, SNAPSHOT_NAME)
+        self.main = os.path.join(root, "Main.json")
+        self.f = None
+        self.edits = 0
+        self.next_uid = 0
+        self.paused = 0
+        # Edits made while no log was open (while the design was loading).
+        self.missed = 0
+
+    def pending(self):
+        # True if an earlier session left changes that never made it into
+        # Main.json (edits in the log, or a snapshot as the base).
+        lines = read_lines(self.path)
+        if not lines:
+            return False
+        return len(lines) > 1 or lines[0].get("file") == SNAPSHOT_NAME
+
+    def recover(self):
+        # The document the journal describes, or None if its base is gone
+        # or was changed behind its back.
+        lines = read_lines(self.path)
+        if not lines or lines[0].get("op") != "base":
+            return None
+        head = lines[0]
+        doc = {"blocks": [], "connections": []}
+        if head.get("file"):
+            base = os.path.join(self.root, head["file"])
+            if digest(base) != head.get("sha1"):
+                return None
+            try:
+                with open(base, "r") as f:
+                    doc = json.load(f)
+            except (OSError, ValueError):
+                return None
+        r = Replay(doc)
+        for e in lines[1:]:
+            r.apply(e)
+        return r.document()
+
+    def start(self, blocks, base):
+        # Begins a fresh log on top of base (a file name in the project, or
+        # None for an empty design) whose blocks are the given ones, in order.
+        self.close()
+        for i, b in enumerate(blocks):
+            b.uid = i
+        self.next_uid = len(blocks)
+        head = {"op": "base", "file": base,
+                "sha1": digest(os.path.join(self.root, base)) if base else None}
+        atomic_write(self.path, (json.dumps(head) + "\n").encode("utf-8"))
+        self.f = open(self.path, "a")
+        self.edits = 0
+        self.missed = 0
+        if base != SNAPSHOT_NAME and os.path.exists(self.snapshot):
+            os.remove(self.snapshot)
+
+    def uid(self, block):
+        u = getattr(block, "uid", None)
+        if u is None:
+            u = block.uid = self.next_uid
+            self.next_uid += 1
+        return u
+
+    def port_ref(self, p):
+        return [self.uid(p.block), p.block.port_symbols.index(p)]
+
+    def record(self, e):
+        if self.f is None or self.paused:
+            return
+        self.f.write(json.dumps(e) + "\n")
+        self.f.flush()
+        self.edits += 1
+
+    def compact(self, snapshot_text, blocks):
+        # Replaces the log by a snapshot of the current design (blocks are
+        # the saved blocks in snapshot order).
+        atomic_write(self.snapshot, snapshot_text.encode("utf-8"))
+        self.start(blocks, SNAPSHOT_NAME)
+
+    def discard(self):
+        self.close()
+        for p in (self.path, self.snapshot):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+def journal_of(canvas):
+    return canvas.data.get("journal")
+
+def record(canvas, op, **fields):
+    # Logs one edit if the canvas has a journal; block/port objects in
+    # fields are turned into uids / port references.
+    j = journal_of(canvas)
+    if j is None or j.paused:
+        return
+    if j.f is None:
+        j.missed += 1
+        return
+    from top_level import block_json, saved_blocks
+    # Adapters are not part of Main.json, so neither are their edits.
+    owners = [fields[k].block if k in ("a", "b") else fields[k] for k in ("a", "b", "block") if k in fields]
+    if len(saved_blocks(owners)) < len(owners):
+        return
+    e = {"op": op}
+    for k, v in fields.items():
+        if k in ("a", "b"):
+            v = j.port_ref(v)
+        elif k == "block" and op != "add":
+            k, v = "uid", j.uid(v)
+        e[k] = v
+    if op == "add":
+        b = fields["block"]
+        # A block put back by undo may still carry a uid from before the
+        # last start(), which renumbered only the blocks then on the canvas.
+        b.uid = None
+        e["uid"] = j.uid(b)
+        e["block"] = block_json(b)
+    j.record(e)
+    if j.edits >= COMPACT_EVERY:
+        compact(canvas)
+
+def compact(canvas):
+    from top_level import design_json_text, saved_blocks, FragmentCache
+    j = journal_of(canvas)
+    if j is None:
+        return
+    b = canvas.data["blocks"]
+    c = canvas.data["connections"]
+    fc = canvas.data.setdefault("fragments", FragmentCache())
+    j.compact(design_json_text(b, c, fc, canvas.data.get("routing")), saved_blocks(b))
@@ -1,20 +1,89 @@
 #main.py
+import os
 import sys
-import tkinter as tk
-from tkinter import filedialog
-from gui import run_gui
+import argparse
+
+def generate(directory, check=False):
+    # Rebuilds Main.vhd (and any subsystem files) from Main.json without the
+    # GUI; tkinter is never imported on this path. With check, only reports
+    # whether they are stale.
+    from design_model import load_design
+    from top_level import render_design
+    from generator import write_outputs, stale_subsystems
+    src = os.path.join(directory, "Main.json")
+    try:
+        d = load_design(src)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"cannot load {src}: {e}", file=sys.stderr)
+        return 2
+    files = render_design(d.blocks, d.connections)
+    if check:
+        rc = 0
+        keep = set()
+        for rel, text in files:
+            dst = os.path.join(directory, *rel.split("/"))
+            keep.add(dst)
+            try:
+                with open(dst, "r") as f:
+                    old = f.read()
+            except OSError:
+                old = None
+            if old != text:
+                print(f"{dst} is out of date", file=sys.stderr)
+                rc = 1
+        for p in stale_subsystems(directory, keep):
+            print(f"{p} is no longer generated", file=sys.stderr)
+            rc = 1
+        return rc
+    write_outputs(directory, files)
+    return 0
+
+def sweep(directory, table, out=None, jobs=None):
+    from sweep import run_sweep, SweepError
+    try:
+        res = run_sweep(directory, table, out, jobs)
+    except (OSError, ValueError, KeyError, SweepError) as e:
+        print(f"sweep failed: {e}", file=sys.stderr)
+        return 2
+    for v, written in res.items():
+        print(f"{v}: {len(written)} file(s) written")
+    return 0
 
 def main():
-    if len(sys.argv) > 1:
-        directory = sys.argv[1]
-    else:
+    ap = argparse.ArgumentParser(description="Efinix System Builder")
+    ap.add_argument("directory", nargs="?", help="VHDL project directory (asked for if omitted)")
+    # Optional second argument: the interface design file, when the project
+    # holds several *.peri.xml.
+    ap.add_argument("peri", nargs="?", help="interface design file (*.peri.xml)")
+    ap.add_argument("--generate", metavar="PROJECT", help="regenerate PROJECT/Main.vhd (and subsystem files) from Main.json and exit")
+    ap.add_argument("--check", action="store_true", help="with --generate: exit 1 if any generated file is out of date, write nothing")
+    ap.add_argument("--sweep", metavar="TABLE", help="render one variant per entry of a generic override table "
+                    "(JSON or CSV) for PROJECT and exit")
+    ap.add_argument("--out", metavar="DIR", help="with --sweep: output root (default PROJECT/sweep)")
+    ap.add_argument("--jobs", type=int, help="with --sweep: worker processes (default: CPU count)")
+    a = ap.parse_args()
+    if a.sweep:
+        project = a.generate or a.directory
+        if not project:
+            ap.error("--sweep needs a project directory")
+        sys.exit(sweep(project, a.sweep, a.out, a.jobs))
+    if a.generate or a.check:
+        project = a.generate or a.directory
+        if not project:
+            ap.error("--check needs a project directory")
+        sys.exit(generate(project, a.check))
+    directory = a.directory
+    if not directory:
+        import tkinter as tk
+        from tkinter import filedialog
         root = tk.Tk()
         root.withdraw()
         directory = filedialog.askdirectory(title="Select VHDL Project Directory")
         root.destroy()
     if not directory:
         sys.exit(1)
-    run_gui(directory)
+    from gui import run_gui
+    run_gui(directory, a.peri)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+#netlist.py
+
+class Net:
+    # One electrical node: every port joined by wires, in block/port order.
+    def __init__(self, ports):
+        self.ports = ports
+        self.name = None
+
+    @property
+    def drivers(self):
+        return [p for p in self.ports if p.port["dir"] in ["out", "inout"]]
+
+    @property
+    def sinks(self):
+        return [p for p in self.ports if p.port["dir"] in ["in", "inout"]]
+
+    @property
+    def type(self):
+        return self.ports[0].port["type"]
+
+class Netlist:
+    # Nets of a design, built with union-find over the connections. Lookups
+    # (port -> net, top-level membership) are dict/set based so building
+    # and naming stay linear in the number of ports and wires.
+    def __init__(self, blocks, connections):
+        self.blocks = blocks
+        self.conduit_blocks = [x for x in blocks if getattr(x, "conduit", False)]
+        self.conduit_ports = [y for x in blocks for y in x.port_symbols if getattr(y, "is_conduit", False)]
+        top = [pt for xx in self.conduit_blocks for pt in xx.port_symbols] + self.conduit_ports
+        self.top_in = {pt for pt in top if pt.port["dir"] in ["in", "inout"]}
+        self.top_out = {pt for pt in top if pt.port["dir"] in ["out", "inout"]}
+        self.top_names = {pt.port["name"] for pt in top}
+        self.nets = []
+        self.net_of = {}
+        self.build(connections)
+        self.name_nets()
+
+    def build(self, connections):
+        parent = {}
+        for x_ in self.blocks:
+            for y_ in x_.port_symbols:
+                parent[y_] = y_
+
+        def fnd(p):
+            r = p
+            while parent[r] is not r:
+                r = parent[r]
+            while parent[p] is not r:
+                parent[p], p = r, parent[p]
+            return r
+
+        for c_ in connections:
+            rp = fnd(c_[0])
+            rq = fnd(c_[1])
+            if rp is not rq:
+                parent[rq] = rp
+
+        groups = {}
+        for x_ in self.blocks:
+            for y_ in x_.port_symbols:
+                groups.setdefault(fnd(y_), []).append(y_)
+        for v_ in groups.values():
+            n = Net(v_)
+            self.nets.append(n)
+            for p in v_:
+                self.net_of[p] = n
+
+    def name_nets(self):
+        # A net touching both top-level inputs and outputs, or none, gets a
+        # numbered sigN; otherwise it takes the first top-level port's name.
+        sc = 1
+        for n in self.nets:
+            i = next((x_ for x_ in n.ports if x_ in self.top_in), None)
+            o = next((x_ for x_ in n.ports if x_ in self.top_out), None)
+            if i is not None and o is not None:
+                n.name = f"sig{sc}"
+                sc += 1
+            elif i is not None:
+                n.name = i.port["name"]
+            elif o is not None:
+                n.name = o.port["name"]
+            else:
+                n.name = f"sig{sc}"
+                sc += 1
+
+    def signal(self, port):
+        n = self.net_of.get(port)
+        return n.name if n is not None else None
+
+    def internal_nets(self):
+        # Nets that need a signal declaration, one per name in first-use order.
+        seen = set()
+        out = []
+        for n in self.nets:
+            if n.name in self.top_names or n.name in seen:
+                continue
+            seen.add(n.name)
+            out.append(n)
+        return out
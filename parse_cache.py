@@ -0,0 +1,104 @@
+#parse_cache.py
+import os
+import json
+import hashlib
+from utils import atomic_write
+
+CACHE_DIR = ".vsb_cache"
+
+def file_fingerprint(pa):
+    st = os.stat(pa)
+    return st.st_mtime_ns, st.st_size
+
+def file_digest(pa):
+    h = hashlib.sha1()
+    with open(pa, "rb") as f:
+        for ch in iter(lambda: f.read(1 << 20), b""):
+            h.update(ch)
+    return h.hexdigest()
+
+def file_stamp(pa):
+    # (mtime_ns, size, sha1) for ParseCache.put, or None if unreadable.
+    try:
+        return file_fingerprint(pa) + (file_digest(pa),)
+    except OSError:
+        return None
+
+class ParseCache:
+    # On-disk memo of per-file parse results, stored under <root>/.vsb_cache/.
+    # Entries are keyed by the path relative to the root and validated by
+    # mtime + size; when those differ but the size still matches, the sha1 of
+    # the content decides (touched-but-identical files stay cached).
+    def __init__(self, root, name, version):
+        self.root = root
+        self.path = os.path.join(root, CACHE_DIR, name + ".json")
+        self.version = version
+        self.entries = {}
+        self.seen = set()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(d, dict) or d.get("version") != self.version:
+            return
+        self.entries = d.get("files", {})
+
+    def key(self, pa):
+        return os.path.relpath(pa, self.root).replace(os.sep, "/")
+
+    def get(self, pa):
+        k = self.key(pa)
+        self.seen.add(k)
+        e = self.entries.get(k)
+        if e is None:
+            return None
+        try:
+            mt, sz = file_fingerprint(pa)
+        except OSError:
+            return None
+        if e["mtime"] == mt and e["size"] == sz:
+            return e["result"]
+        if e["size"] == sz and e.get("sha1") == file_digest(pa):
+            e["mtime"] = mt
+            self.dirty = True
+            return e["result"]
+        return None
+
+    def put(self, pa, result, stamp):
+        # stamp: (mtime_ns, size, sha1) of the content result was parsed
+        # from, taken by the parser; None (the file changed meanwhile)
+        # stores nothing.
+        k = self.key(pa)
+        self.seen.add(k)
+        if stamp is None:
+            return
+        mt, sz, dg = stamp
+        self.entries[k] = {"mtime": mt, "size": sz, "sha1": dg, "result": result}
+        self.dirty = True
+
+    def drop(self, pa):
+        if self.entries.pop(self.key(pa), None) is not None:
+            self.dirty = True
+
+    def evict_unseen(self):
+        stale = [k for k in self.entries if k not in self.seen]
+        for k in stale:
+            del self.entries[k]
+        if stale:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = json.dumps({"version": self.version, "files": self.entries}).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write(self.path, data)
+        except OSError:
+            return
+        self.dirty = False
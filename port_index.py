@@ -0,0 +1,55 @@
+#port_index.py
+
+# Ports on the canvas grouped by (direction, kind, width): every port in a
+# bucket accepts exactly the same wires, so the legal targets of a drag are
+# a handful of whole buckets. Each port item also carries its bucket as a
+# canvas tag, which lets a bucket be highlighted with one itemconfig.
+TARGET_DIRS = {
+    "out": ("in", "inout"),
+    "in": ("out", "inout"),
+    "inout": ("in", "out", "inout")
+}
+
+def bucket(d, ptype):
+    # The width only matters for vector kinds (see PortType.compatible).
+    k = ptype.kind
+    w = ptype.width if k in ("SLV", "SIGNED", "UNSIGNED") else None
+    return (d, k, w)
+
+def bucket_tag(b):
+    return "pt:%s:%s:%s" % (b[0], b[1], "-" if b[2] is None else b[2])
+
+def target_buckets(b):
+    # Buckets a wire from a port in bucket b may end in: same check_dir
+    # and types_compatible rules, applied to whole buckets.
+    d, k, w = b
+    kinds = [(k, w)]
+    if k == "SL":
+        kinds.append(("SLV", 1))
+    elif k == "SLV" and w == 1:
+        kinds.append(("SL", None))
+    return [(td, tk, tw) for td in TARGET_DIRS.get(d, ()) for tk, tw in kinds]
+
+class PortIndex:
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, p):
+        s = self.buckets.get(p.bucket)
+        if s is None:
+            s = self.buckets[p.bucket] = set()
+        s.add(p)
+
+    def remove(self, p):
+        s = self.buckets.get(p.bucket)
+        if s is not None:
+            s.discard(p)
+            if not s:
+                del self.buckets[p.bucket]
+
+    def targets(self, p):
+        # Non-empty buckets p may be wired to.
+        return [b for b in target_buckets(p.bucket) if b in self.buckets]
+
+    def ports(self, b):
+        return self.buckets.get(b, ())
@@ -1,7 +1,13 @@
 #port_symbol.py
 import tkinter as tk
-from utils import check_dir, types_compatible, extract_kind, extract_width
+from utils import port_type
 from color_manager import ColorManager
+from history import connect, disconnect_all, change, Conduit
+from viewport import to_view, smooth
+from port_index import bucket, bucket_tag
+
+# Drops within this many pixels of a compatible port snap to it.
+SNAP_RADIUS = 20
 
 class PortSymbol:
     cm = ColorManager()
@@ -12,16 +18,18 @@ class PortSymbol:
         self.block = block
         self.port = port
         self.is_conduit = False
-        k = port["type"].lower()
+        self.ptype = port_type(port["type"])
+        self.bucket = bucket(port["dir"], self.ptype)
+        bt = bucket_tag(self.bucket)
         self.shape = "square"
         self.r = 5
-        if "std_logic" in k and "vector" not in k:
+        if self.ptype.kind == "SL":
             self.shape = "circle"
         if self.shape == "circle":
             self.id = self.canvas.create_oval(
                 self.x - self.r, self.y - self.r,
                 self.x + self.r, self.y + self.r,
-                fill="black", outline="black"
+                fill="black", outline="black", tags=(block.tag, "port", bt)
             )
         else:
             s = 10
@@ -29,7 +37,7 @@ class PortSymbol:
             self.id = self.canvas.create_rectangle(
                 self.x - self.r, self.y - self.r,
                 self.x + self.r, self.y + self.r,
-                fill="black", outline="black"
+                fill="black", outline="black", tags=(block.tag, "port", bt)
             )
         disp_label = port["name"]
         if port["dir"] in ["in", "inout"]:
@@ -39,16 +47,10 @@ class PortSymbol:
             off = -15
             anch = "e"
         self.label_id = self.canvas.create_text(
-            self.x + off, self.y, text=disp_label, anchor=anch, fill="black"
+            self.x + off, self.y, text=disp_label, anchor=anch, fill="black", tags=(block.tag, "port", "label")
         )
-        self.canvas.tag_bind(self.id, "<ButtonPress-1>", self.on_press)
-        self.canvas.tag_bind(self.id, "<B1-Motion>", self.on_drag)
-        self.canvas.tag_bind(self.id, "<ButtonRelease-1>", self.on_release)
-        self.canvas.tag_bind(self.label_id, "<ButtonPress-1>", self.on_press)
-        self.canvas.tag_bind(self.label_id, "<B1-Motion>", self.on_drag)
-        self.canvas.tag_bind(self.label_id, "<ButtonRelease-1>", self.on_release)
-        self.canvas.tag_bind(self.id, "<Button-3>", self.on_port_right_click)
-        self.canvas.tag_bind(self.label_id, "<Button-3>", self.on_port_right_click)
+        # Events arrive through the canvas-wide "port" tag bindings, which
+        # look the port up in port_map (see gui.bind_items).
         self.dragging = False
         self.color = inherited_color if inherited_color else None
         if not self.color and self.port["dir"] in ["out", "inout"]:
@@ -57,18 +59,41 @@ class PortSymbol:
     def on_press(self, event):
         self.dragging = True
         if self.canvas.data["active_line"] is None:
+            vx, vy = to_view(self.canvas, self.x, self.y)
             ln = self.canvas.create_line(
-                self.x, self.y, self.x, self.y,
+                vx, vy, vx, vy,
                 fill=self.color if self.color else "black",
                 tags=("wire",),
-                smooth=True, splinesteps=36, width=3
+                smooth=smooth(self.canvas), splinesteps=36, width=3
             )
             self.canvas.data["active_line"] = ln
             self.canvas.data["active_port"] = self
+            self.highlight_targets(3)
+
+    def highlight_targets(self, width):
+        # One itemconfig per legal bucket, however many ports it holds.
+        for b in self.canvas.data["port_index"].targets(self):
+            self.canvas.itemconfig(bucket_tag(b), width=width)
+
+    def snap_target(self, ex, ey):
+        # The closest legal port around the drop point, if any.
+        legal = set(self.canvas.data["port_index"].targets(self))
+        pm = self.canvas.data["port_map"]
+        best = None
+        r = SNAP_RADIUS
+        for obj_id in self.canvas.find_overlapping(ex-r, ey-r, ex+r, ey+r):
+            tp = pm.get(obj_id)
+            if tp is None or tp is self or tp.bucket not in legal:
+                continue
+            vx, vy = to_view(self.canvas, tp.x, tp.y)
+            d = (vx - ex) ** 2 + (vy - ey) ** 2
+            if best is None or d < best[0]:
+                best = (d, tp)
+        return best[1] if best else None
 
     def on_drag(self, event):
         if self.dragging and self.canvas.data["active_line"]:
-            stx, sty = self.x, self.y
+            stx, sty = to_view(self.canvas, self.x, self.y)
             ex = self.canvas.canvasx(event.x)
             ey = self.canvas.canvasy(event.y)
             cx1 = stx + (ex - stx) / 2
@@ -86,41 +111,25 @@ class PortSymbol:
         self.dragging = False
         line_id = self.canvas.data["active_line"]
         source_port = self.canvas.data["active_port"]
-        success = False
+        source_port.highlight_targets(1)
         ex = self.canvas.canvasx(event.x)
         ey = self.canvas.canvasy(event.y)
-        overlapping = self.canvas.find_overlapping(ex-5, ey-5, ex+5, ey+5)
-        for obj_id in overlapping:
-            if obj_id != self.id and obj_id in self.canvas.data["port_map"]:
-                target_port = self.canvas.data["port_map"][obj_id]
-                if target_port != source_port and check_dir(source_port.port["dir"], target_port.port["dir"]):
-                    a_kind  = extract_kind(source_port.port["type"])
-                    a_width = extract_width(source_port.port["type"])
-                    b_kind  = extract_kind(target_port.port["type"])
-                    b_width = extract_width(target_port.port["type"])
-                    if types_compatible({"kind": a_kind, "width": a_width},
-                                        {"kind": b_kind, "width": b_width}):
-                        self.update_wire(line_id, source_port, target_port)
-                        success = True
-        if not success:
+        target_port = source_port.snap_target(ex, ey)
+        if target_port is not None:
+            self.update_wire(line_id, source_port, target_port)
+        else:
             self.canvas.delete(line_id)
         self.canvas.data["active_line"] = None
         self.canvas.data["active_port"] = None
 
     def update_wire(self, ln, sp, tp):
-        self.canvas.coords(
-            ln,
-            sp.x, sp.y,
-            (sp.x + tp.x) / 2, sp.y,
-            (sp.x + tp.x) / 2, tp.y,
-            tp.x, tp.y
-        )
+        # connect() routes the line between the two ports.
         self.canvas.itemconfig(
             ln,
-            smooth=True, splinesteps=36, width=3,
+            smooth=smooth(self.canvas), splinesteps=36, width=3,
             fill=self.color if self.color else "black"
         )
-        self.canvas.data["connections"].append((sp, tp, ln, None))
+        connect(self.canvas, (sp, tp, ln, None))
 
     def on_port_right_click(self, event):
         menu = tk.Menu(self.canvas, tearoff=0)
@@ -134,16 +143,11 @@ class PortSymbol:
 
     def export_as_conduit(self):
         if not self.is_conduit:
-            self.is_conduit = True
-            self.canvas.itemconfig(self.id, fill="black", outline="red")
+            change(self.canvas, Conduit(self, False, True))
 
     def remove_conduit(self):
         if self.is_conduit:
-            self.is_conduit = False
-            self.canvas.itemconfig(self.id, fill="black", outline="black")
+            change(self.canvas, Conduit(self, True, False))
 
     def remove_all_connections(self):
-        conns = [c for c in self.canvas.data["connections"] if c[0] == self or c[1] == self]
-        for c_ in conns:
-            self.canvas.delete(c_[2])
-            self.canvas.data["connections"].remove(c_)
+        disconnect_all(self.canvas, [self])
@@ -0,0 +1,56 @@
+#router.py
+
+# Orthogonal wire routing. A wire leaves its source port horizontally,
+# runs vertically in a channel and enters the target horizontally. Each
+# channel is a lane LANE model units wide; a wire takes the lane nearest
+# the midpoint between its ports whose vertical runs do not overlap its
+# own, so parallel wires stay apart. Routes are cached per line and only
+# recomputed when one of the wire's ports moved.
+ROUTING_MODES = ("spline", "orthogonal")
+LANE = 6
+MAX_LANES = 24
+
+def spans_overlap(a0, a1, b0, b1):
+    return a0 <= b1 and b0 <= a1
+
+class OrthogonalRouter:
+    def __init__(self):
+        self.routes = {}
+        self.lanes = {}
+
+    def route(self, ln, p1, p2):
+        # Model-space points (sx, sy, cx, sy, cx, ey, ex, ey) of wire ln.
+        key = (p1.x, p1.y, p2.x, p2.y)
+        r = self.routes.get(ln)
+        if r is not None and r[0] == key:
+            return r[2]
+        self.release(ln)
+        sx, sy, ex, ey = key
+        y0, y1 = min(sy, ey), max(sy, ey)
+        base = round((sx + (ex - sx) / 2) / LANE)
+        lane = base
+        for k in range(MAX_LANES):
+            # base, base+1, base-1, base+2, ...
+            lane = base + (k + 1) // 2 * (1 if k % 2 else -1)
+            if not any(spans_overlap(y0, y1, a, b) for a, b, _ in self.lanes.get(lane, ())):
+                break
+        else:
+            lane = base
+        cx = lane * LANE
+        pts = (sx, sy, cx, sy, cx, ey, ex, ey)
+        self.lanes.setdefault(lane, []).append((y0, y1, ln))
+        self.routes[ln] = (key, lane, pts)
+        return pts
+
+    def release(self, ln):
+        r = self.routes.pop(ln, None)
+        if r is None:
+            return
+        occ = self.lanes[r[1]]
+        occ[:] = [o for o in occ if o[2] != ln]
+        if not occ:
+            del self.lanes[r[1]]
+
+    def clear(self):
+        self.routes.clear()
+        self.lanes.clear()
@@ -0,0 +1,146 @@
+#sweep.py
+import os
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from design_model import load_design
+from netlist import Netlist
+from top_level import render_design, design_json_text, FragmentCache, unit_blocks, instance_names
+from generator import write_outputs
+
+# Generic sweeps: many variants of one Main.json that only differ in generic
+# values. The table maps variant -> instance -> generic -> value, where an
+# instance is its label in the generated VHDL (fifo_inst, fifo_inst1, ...),
+# qualified by its unit (Main.fifo_inst, sub1.fifo_inst) where the label is
+# used in more than one, or a block name (every block of that name).
+
+class SweepError(Exception):
+    pass
+
+def read_table(path):
+    # JSON: {"variant": {"instance": {"GENERIC": value}}}, or CSV with the
+    # columns variant,instance,generic,value.
+    if path.lower().endswith(".csv"):
+        t = {}
+        with open(path, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    v, i, g, x = row["variant"], row["instance"], row["generic"], row["value"]
+                except KeyError as e:
+                    raise SweepError(f"{path}: missing column {e}")
+                t.setdefault(v.strip(), {}).setdefault(i.strip(), {})[g.strip()] = x.strip()
+        return t
+    with open(path, "r") as f:
+        t = json.load(f)
+    if not isinstance(t, dict):
+        raise SweepError(f"{path}: expected an object of variants")
+    return t
+
+def generic_value(g, v):
+    # Same conversion as the generics dialog of EntityBlock.
+    if g["type"].lower() == "integer" and isinstance(v, str):
+        return int(v)
+    if g["type"].lower() == "string" and isinstance(v, str):
+        if not (v.startswith('"') and v.endswith('"')):
+            return '"'+v+'"'
+    return v
+
+def resolve(blocks, table):
+    # Turns the table into {variant: [(block index, {generic: value})]},
+    # checking every instance and generic name.
+    labels = {}
+    by_name = {}
+    index = {id(x): i for i, x in enumerate(blocks)}
+    units = {}
+    for unit, ublocks in unit_blocks(blocks).items():
+        for blk, iname in instance_names(ublocks):
+            labels[f"{unit}.{iname}"] = [index[id(blk)]]
+            labels.setdefault(iname, []).append(index[id(blk)])
+            units.setdefault(iname, []).append(unit)
+            by_name.setdefault(blk.name, []).append(index[id(blk)])
+    out = {}
+    for variant, inst in table.items():
+        if not isinstance(inst, dict):
+            raise SweepError(f"variant {variant}: expected an object of instances")
+        ov = {}
+        for iname, gens in inst.items():
+            if len(units.get(iname, ())) > 1:
+                raise SweepError(f"variant {variant}: instance label {iname} is used in "
+                                 f"{', '.join(units[iname])}; write <unit>.{iname}")
+            idxs = labels.get(iname) or by_name.get(iname)
+            if not idxs:
+                raise SweepError(f"variant {variant}: no instance or block named {iname}")
+            for i in idxs:
+                decl = {g["name"]: g for g in (blocks[i].generics or [])}
+                for gn, v in gens.items():
+                    if gn not in decl:
+                        raise SweepError(f"variant {variant}: {iname} has no generic {gn}")
+                    try:
+                        ov.setdefault(i, {})[gn] = generic_value(decl[gn], v)
+                    except ValueError:
+                        raise SweepError(f"variant {variant}: {iname}.{gn}: {v!r} is not an integer")
+        out[variant] = sorted(ov.items())
+    return out
+
+# Per-process state: the design, its netlist and the fragment cache are
+# built once per worker and shared by every variant it renders.
+_state = {}
+
+def init_worker(main_json):
+    d = load_design(main_json)
+    _state["design"] = d
+    _state["netlist"] = Netlist(d.blocks, d.connections)
+    _state["cache"] = FragmentCache()
+
+def render_variant(job):
+    name, overrides, out_dir = job
+    d = _state["design"]
+    fc = _state["cache"]
+    saved = []
+    for i, vals in overrides:
+        blk = d.blocks[i]
+        saved.append((blk, blk.generic_values))
+        blk.generic_values = dict(blk.generic_values, **vals)
+        fc.mark_dirty(blk)
+    try:
+        files = render_design(d.blocks, d.connections, fc, _state["netlist"])
+        files.append(("Main.json", design_json_text(d.blocks, d.connections, fc, d.routing)))
+        return name, write_outputs(out_dir, files)
+    finally:
+        for blk, gv in saved:
+            blk.generic_values = gv
+            fc.mark_dirty(blk)
+
+def variant_dir(out_root, name):
+    if not name or name in (".", "..") or "/" in name or os.sep in name:
+        raise SweepError(f"invalid variant name {name!r}")
+    return os.path.join(out_root, name)
+
+# Below this many variants a process pool costs more than it saves.
+PARALLEL_MIN_VARIANTS = 4
+
+def run_sweep(project, table_path, out_root=None, workers=None):
+    # Renders every variant into out_root/<variant>/ (default
+    # <project>/sweep). Returns {variant: written paths}.
+    main_json = os.path.join(project, "Main.json")
+    if out_root is None:
+        out_root = os.path.join(project, "sweep")
+    d = load_design(main_json)
+    plan = resolve(d.blocks, read_table(table_path))
+    jobs = [(v, ov, variant_dir(out_root, v)) for v, ov in plan.items()]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    done = None
+    if workers > 1 and len(jobs) >= PARALLEL_MIN_VARIANTS:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(main_json,)) as ex:
+                done = list(ex.map(render_variant, jobs))
+        except (OSError, BrokenProcessPool, NotImplementedError):
+            done = None
+    if done is None:
+        init_worker(main_json)
+        done = [render_variant(j) for j in jobs]
+    return dict(done)
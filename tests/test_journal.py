@@ -0,0 +1,32 @@
+#tests/test_journal.py
+import json
+from bench.headless import headless, new_canvas
+from bench.synth import make_project
+
+def design(canvas):
+    from top_level import design_json
+    return json.loads(json.dumps(design_json(canvas.data["blocks"], canvas.data["connections"])))
+
+def test_undo_delete_after_compact(tmp_path):
+    # delete -> compact -> undo: the block put back must not share a uid
+    # with a block renumbered by the compaction.
+    root = str(tmp_path)
+    make_project(root, entities=4, ports=4, generics=0, depth=1, pins=0, plls=0,
+                 instances=4, connections=6)
+    with headless():
+        import gui
+        from history import History, delete_block
+        from journal import Journal, compact
+        from top_level import saved_blocks
+        canvas = new_canvas(root)
+        gui.load_previous_configuration(canvas, root + "/Main.json")
+        j = canvas.data["journal"] = Journal(root)
+        j.start(saved_blocks(canvas.data["blocks"]), "Main.json")
+        h = canvas.data["history"] = History(canvas)
+        delete_block(canvas, canvas.data["blocks"][1])
+        compact(canvas)
+        h.undo()
+        want = design(canvas)
+        assert len(want["blocks"]) == 4
+        j.close()
+        assert Journal(root).recover() == want
@@ -0,0 +1,405 @@
+#top_level.py
+import re
+import json
+import weakref
+from collections import defaultdict
+from utils import port_type
+from netlist import Netlist
+
+# Pure text generation for Main.vhd, subsystem files and Main.json. Works on any blocks with
+# name/conduit/generics/generic_values/port_symbols and ports with
+# block/port/ptype/is_conduit/x/y/color: the canvas widgets (EntityBlock,
+# PortSymbol) or the design_model classes. No tkinter import here.
+
+def flip_direction(d):
+    if d == "in":
+        return "out"
+    if d == "out":
+        return "in"
+    return d
+
+def get_default_assignment(v):
+    s = v.lower()
+    m = re.search(r'\((\d+)\s*downto\s*(\d+)\)', s)
+    if not m:
+        m = re.search(r'\((\d+):0\)', s)
+    if "std_logic_vector" in s or "signed" in s or "unsigned" in s:
+        if m:
+            hi = int(m.group(1))
+            lo = int(m.group(2))
+            w = abs(hi - lo) + 1
+            return "(others => '0')" if w > 1 else "'0'"
+        return "(others => '0')"
+    if "std_logic" in s:
+        return "'0'"
+    if "integer" in s:
+        return "0"
+    return "'0'"
+
+def normalize_type(ptype):
+    t = port_type(ptype)
+    if t.is_vector() and t.width == 1:
+        return "std_logic"
+    return ptype
+
+def is_conduit_block(x):
+    return getattr(x, "conduit", False)
+
+def render_component(comp, blks):
+    # One declaration per entity name; like before, it lists the ports
+    # and generics of every instance of that name.
+    prts = [p_.port for x_ in blks for p_ in x_.port_symbols]
+    gens = [g_ for x_ in blks if x_.generics for g_ in x_.generics]
+    f = [f"    component {comp} is\n"]
+    if gens:
+        f.append("        generic(\n")
+        for i, g_ in enumerate(gens):
+            line = f"            {g_['name']} : {g_['type']}"
+            if g_.get("default"):
+                line += f" := {g_['default']}"
+            if i < len(gens) - 1:
+                line += ";"
+            f.append(line + "\n")
+        f.append("        );\n")
+    f.append("        port(\n")
+    for i, p_ in enumerate(prts):
+        line = f"            {p_['name']} : {p_['dir']} {p_['type']}"
+        if i < len(prts) - 1:
+            line += ";"
+        f.append(line + "\n")
+    f.append("        );\n")
+    f.append(f"    end component;\n\n")
+    return "".join(f)
+
+def generic_map(blk):
+    gm = []
+    for g_ in blk.generics:
+        gn = g_["name"]
+        gv = blk.generic_values.get(gn, g_.get("default"))
+        if isinstance(gv, str) and not (gv.startswith("'") or gv.startswith('"')):
+            gv = f'"{gv}"'
+        gm.append(f"        {gn} => {gv}")
+    return ",\n".join(gm)
+
+def render_instance(blk, iname, gmap, signals):
+    f = []
+    if blk.generics:
+        f.append(f"    {iname} : {blk.name} generic map(\n")
+        f.append(gmap)
+        f.append("\n    ) port map(\n")
+    else:
+        f.append(f"    {iname} : {blk.name} port map(\n")
+    lines_map = []
+    for ps_, sg in zip(blk.port_symbols, signals):
+        pn = ps_.port['name']
+        if ps_.ptype.is_vector() and ps_.ptype.width == 1:
+            comp_port_name = f"{pn}(0)"
+        else:
+            comp_port_name = pn
+
+        if sg is not None:
+            lines_map.append(f"        {comp_port_name} => {sg}")
+        else:
+            if ps_.port["dir"] in ["in", "inout"]:
+                df = get_default_assignment(ps_.port["type"])
+                lines_map.append(f"        {comp_port_name} => {df}")
+            else:
+                lines_map.append(f"        {comp_port_name} => open")
+    f.append(",\n".join(lines_map))
+    f.append("\n    );\n\n")
+    return "".join(f)
+
+class FragmentCache:
+    # Memoized component declarations and instance port maps. A block's
+    # signature (name, generics, ports, generic map) is kept until the
+    # block is marked dirty; a fragment is re-rendered only when its key
+    # (signatures, instance name, connected net names) differs from the
+    # one it was rendered with.
+    def __init__(self):
+        self.sigs = weakref.WeakKeyDictionary()
+        self.instances = weakref.WeakKeyDictionary()
+        self.components = {}
+        self.json = weakref.WeakKeyDictionary()
+        self.rendered = 0
+        self.reused = 0
+
+    def block_text(self, blk, bd):
+        return self.lookup(self.json, blk, bd, lambda: json.dumps(bd, indent=2))
+
+    def mark_dirty(self, block):
+        self.sigs.pop(block, None)
+
+    def clear(self):
+        self.sigs.clear()
+        self.instances.clear()
+        self.components.clear()
+        self.json.clear()
+
+    def signature(self, blk):
+        s = self.sigs.get(blk)
+        if s is None:
+            gens = tuple((g["name"], g["type"], g.get("default")) for g in (blk.generics or ()))
+            ports = tuple((p.port["name"], p.port["dir"], p.port["type"]) for p in blk.port_symbols)
+            s = (blk.name, gens, ports, generic_map(blk) if blk.generics else "")
+            self.sigs[blk] = s
+        return s
+
+    def lookup(self, store, k, key, render):
+        hit = store.get(k)
+        if hit is not None and hit[0] == key:
+            self.reused += 1
+            return hit[1]
+        self.rendered += 1
+        text = render()
+        store[k] = (key, text)
+        return text
+
+    def component(self, comp, blks, unit="Main"):
+        key = tuple(self.signature(x_)[:3] for x_ in blks)
+        return self.lookup(self.components, (unit, comp), key, lambda: render_component(comp, blks))
+
+    def instance(self, blk, iname, signals):
+        sig = self.signature(blk)
+        key = (iname, sig, signals)
+        return self.lookup(self.instances, blk, key, lambda: render_instance(blk, iname, sig[3], signals))
+
+def mark_dirty(canvas, block):
+    # Call after changing a block's name, generics or generic values.
+    fc = canvas.data.get("fragments")
+    if fc is not None:
+        fc.mark_dirty(block)
+
+SUBSYSTEM_DIR = "subsystems"
+# First line of every generated subsystem file; stale ones are recognised by it.
+SUBSYSTEM_MARK = "-- Generated by Efinix System Builder: subsystem "
+
+def subsystem_of(x):
+    # Conduit blocks are the board boundary and always stay in Main.
+    if is_conduit_block(x):
+        return None
+    return getattr(x, "subsystem", None) or None
+
+def port_lines(ports):
+    f = []
+    for i, (pname, odir, ptype) in enumerate(ports):
+        line = f"        {pname} : {odir} {ptype}"
+        if i < len(ports) - 1:
+            line += ";"
+        f.append(line + "\n")
+    return f
+
+def instance_names(blocks):
+    # [(block, instance label)] for the blocks of one entity, in order.
+    instance_count = defaultdict(int)
+    out = []
+    for blk in blocks:
+        instance_count[blk.name] += 1
+        idx = instance_count[blk.name] - 1
+        out.append((blk, f"{blk.name}_inst{idx}" if instance_count[blk.name] > 1 else f"{blk.name}_inst"))
+    return out
+
+def unit_blocks(b):
+    # {unit name: blocks}: "Main" first, then subsystems in order of first use.
+    units = {"Main": []}
+    for x_ in b:
+        if is_conduit_block(x_):
+            continue
+        units.setdefault(subsystem_of(x_) or "Main", []).append(x_)
+    return units
+
+def subsystem_clash(b, name):
+    # What a subsystem called name would share a VHDL name with (names are
+    # case-insensitive): an entity of the design, or an instance label,
+    # including its own <name>_inst. None if it is free.
+    n = name.lower()
+    names = {x_.name.lower() for x_ in b if not hasattr(x_, "mode")}
+    labels = set()
+    for blks in unit_blocks(b).values():
+        labels.update(iname.lower() for _, iname in instance_names(blks))
+    if n in names:
+        return f"entity '{name}'"
+    if n in labels:
+        return f"instance label '{name}'"
+    if n + "_inst" in names or n + "_inst" in labels:
+        return f"instance label '{name}_inst'"
+    return None
+
+def render_unit(name, ports, signals, blocks, nl, cache, subsystems=()):
+    # One entity/architecture: ports and signals are (name, [dir,] type)
+    # tuples, blocks are instantiated here and subsystems are (name, ports)
+    # instantiated as components of their own.
+    f = []
+    if name != "Main":
+        f.append(SUBSYSTEM_MARK + name + "\n")
+    f.append("library ieee;\nuse ieee.std_logic_1164.all;\nuse ieee.numeric_std.all;\n\n")
+    f.append(f"entity {name} is\n")
+    f.append("    port(\n")
+    f.extend(port_lines(ports))
+    f.append("    );\n")
+    f.append(f"end {name};\n\n")
+    f.append(f"architecture Behavioral of {name} is\n")
+    if signals:
+        for sg, st in signals:
+            f.append(f"    signal {sg} : {st};\n")
+        f.append("\n")
+    comp_blocks = defaultdict(list)
+    for x_ in blocks:
+        if hasattr(x_, "mode"):
+            continue
+        comp_blocks[x_.name].append(x_)
+    for comp, blks in comp_blocks.items():
+        f.append(cache.component(comp, blks, name))
+    for sub, sports in subsystems:
+        f.append(f"    component {sub} is\n")
+        f.append("        port(\n")
+        f.extend("    " + ln for ln in port_lines(sports))
+        f.append("        );\n")
+        f.append(f"    end component;\n\n")
+    f.append("begin\n\n")
+    for blk, iname in instance_names(blocks):
+        f.append(cache.instance(blk, iname, tuple(nl.signal(ps_) for ps_ in blk.port_symbols)))
+    for sub, sports in subsystems:
+        f.append(f"    {sub}_inst : {sub} port map(\n")
+        f.append(",\n".join(f"        {pn} => {pn}" for pn, _, _ in sports))
+        f.append("\n    );\n\n")
+    f.append("end Behavioral;\n")
+    return "".join(f)
+
+def subsystem_port_dir(inside, outside):
+    # Driven only from inside -> out, only from outside -> in, else inout.
+    # A conduit-exported input inside the subsystem is driven by the board.
+    din = any(p.port["dir"] in ["out", "inout"] for p in inside)
+    dout = any(p.port["dir"] in ["out", "inout"] for p in outside) or \
+        any(p.is_conduit and p.port["dir"] in ["in", "inout"] for p in inside)
+    if din and not dout:
+        return "out"
+    if dout and not din:
+        return "in"
+    return "inout" if din else "in"
+
+def render_design(b, c, cache=None, nl=None):
+    # Generated VHDL as [(relative path, text)]: Main.vhd first, then one
+    # file per subsystem (blocks with a .subsystem name) in order of first
+    # use. Without subsystems this is exactly the flat Main.vhd. Pass a
+    # FragmentCache kept across calls to reuse unchanged fragments, and a
+    # prebuilt Netlist of b/c when rendering several variants of one design.
+    if cache is None:
+        cache = FragmentCache()
+    if nl is None:
+        nl = Netlist(b, c)
+    unique_ports = {}
+    all_conduits = [pt for xx in nl.conduit_blocks for pt in xx.port_symbols] + nl.conduit_ports
+    for pt in all_conduits:
+        pname = pt.port['name']
+        if pname not in unique_ports:
+            if is_conduit_block(pt.block):
+                od = flip_direction(pt.port["dir"])
+            else:
+                od = pt.port["dir"]
+            unique_ports[pname] = (pname, od, normalize_type(pt.port["type"]))
+    subs = unit_blocks(b)
+    main_blocks = subs.pop("Main")
+    sub_ports = {s: {} for s in subs}
+    sub_signals = {s: [] for s in subs}
+    local = set()
+    for n in nl.nets:
+        units = {subsystem_of(p.block) for p in n.ports}
+        top = n.name in nl.top_names
+        for s in units:
+            if s is None:
+                continue
+            inside = [p for p in n.ports if subsystem_of(p.block) == s]
+            if len(units) == 1 and not top:
+                if n.name not in local:
+                    sub_signals[s].append((n.name, normalize_type(n.type)))
+                    local.add(n.name)
+                continue
+            outside = [p for p in n.ports if subsystem_of(p.block) != s]
+            d = subsystem_port_dir(inside, outside)
+            # Nets sharing a top-level name meet at one board port.
+            old = sub_ports[s].get(n.name)
+            if old is not None and old[1] != d:
+                d = "inout"
+            sub_ports[s][n.name] = (n.name, d, normalize_type(n.type) if old is None else old[2])
+    main_signals = [(n.name, normalize_type(n.type)) for n in nl.internal_nets() if n.name not in local]
+    out = [("Main.vhd", render_unit("Main", list(unique_ports.values()), main_signals, main_blocks, nl, cache,
+                                    [(s, list(sub_ports[s].values())) for s in subs]))]
+    for s, blks in subs.items():
+        out.append((f"{SUBSYSTEM_DIR}/{s}.vhd",
+                    render_unit(s, list(sub_ports[s].values()), sub_signals[s], blks, nl, cache)))
+    return out
+
+def block_json(block):
+    bd = {}
+    bd["type"] = "entity"
+    bd["name"] = block.name
+    bd["x"] = block.x
+    bd["y"] = block.y
+    if hasattr(block, "conduit"):
+        bd["conduit"] = block.conduit
+    if getattr(block, "subsystem", None):
+        bd["subsystem"] = block.subsystem
+    if hasattr(block, "generics"):
+        bd["generics"] = block.generics
+        # A copy: the dict is edited in place and bd doubles as a cache key.
+        bd["generic_values"] = dict(getattr(block, "generic_values", {}))
+    ports_arr = []
+    for ps_ in block.port_symbols:
+        p_js = {}
+        p_js["port_name"] = ps_.port["name"]
+        p_js["port_dir"] = ps_.port["dir"]
+        p_js["port_type"] = ps_.port["type"]
+        p_js["x"] = ps_.x
+        p_js["y"] = ps_.y
+        p_js["is_conduit"] = getattr(ps_, "is_conduit", False)
+        if ps_.port["dir"] in ["out", "inout"]:
+            p_js["color"] = ps_.color if ps_.color else None
+        ports_arr.append(p_js)
+    bd["ports"] = ports_arr
+    return bd
+
+def saved_blocks(b):
+    return [block for block in b if not hasattr(block, "mode")]
+
+def design_json(b, c, routing=None):
+    # The Main.json document for blocks b and connections c; routing is
+    # only written when it is not the default spline mode.
+    out_json = {}
+    out_json["blocks"] = [block_json(block) for block in saved_blocks(b)]
+    out_json["connections"] = []
+    for c_ in c:
+        p1, p2 = c_[0], c_[1]
+        out_json["connections"].append({
+            "block1": p1.block.name,
+            "block2": p2.block.name,
+            "port1": p1.port["name"],
+            "port2": p2.port["name"]
+        })
+    if routing and routing != "spline":
+        out_json["routing"] = routing
+    return out_json
+
+def json_array(key, items, last=False):
+    # Same layout as json.dumps(..., indent=2) for one top-level array of
+    # already dumped (indent=2) items.
+    if not items:
+        return f'  "{key}": []' + ("" if last else ",")
+    body = ",\n".join("    " + t.replace("\n", "\n    ") for t in items)
+    return f'  "{key}": [\n{body}\n  ]' + ("" if last else ",")
+
+def connection_text(x):
+    return ("{\n" + ",\n".join(f'  "{k}": {json.dumps(v)}' for k, v in x.items()) + "\n}")
+
+def design_json_text(b, c, cache=None, routing=None):
+    # json.dumps(design_json(b, c, routing), indent=2), with each block's
+    # text reused from the cache while its JSON content is unchanged.
+    d = design_json(b, c, routing)
+    if cache is None:
+        return json.dumps(d, indent=2)
+    blocks = [cache.block_text(blk, bd) for blk, bd in zip(saved_blocks(b), d["blocks"])]
+    conns = [connection_text(x) for x in d["connections"]]
+    tail = ""
+    if "routing" in d:
+        tail = f'\n  "routing": {json.dumps(d["routing"])}'
+    return ("{\n" + json_array("blocks", blocks) + "\n" + json_array("connections", conns, not tail)
+            + tail + "\n}")
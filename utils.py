@@ -1,9 +1,15 @@
 #utils.py
 # utils.py
+import os
 import re
+import hashlib
+import tempfile
+import weakref
+from functools import lru_cache
 
-def extract_kind(v):
-    s = v.lower().strip()
+_RANGE = re.compile(r"\((\d+)\s*(?:downto|to|:)\s*(\d+)\)")
+
+def type_kind(s):
     if "std_logic" in s:
         if "vector" in s:
             return "SLV"
@@ -16,18 +22,66 @@ def extract_kind(v):
         return "INTEGER"
     return "OTHER"
 
+class PortType:
+    # Parsed form of a port type string. Instances are interned on the
+    # normalised text (lowercase, single spaces), so equal types share one
+    # object and compare by identity.
+    __slots__ = ("text", "kind", "width", "high", "low", "__weakref__")
+
+    def __init__(self, text):
+        self.text = text
+        self.kind = type_kind(text)
+        self.high = self.low = None
+        self.width = None
+        m = _RANGE.search(text)
+        if m:
+            self.high = int(m.group(1))
+            self.low = int(m.group(2))
+            self.width = abs(self.high - self.low) + 1
+        elif self.kind == "SL":
+            self.width = 1
+
+    def is_vector(self):
+        return "std_logic_vector" in self.text
+
+    def compatible(self, other):
+        if self is other:
+            return True
+        ka = self.kind
+        kb = other.kind
+        # Allow connection between a 1-bit vector and a scalar std_logic.
+        if (ka == "SLV" and self.width == 1 and kb == "SL") or (kb == "SLV" and other.width == 1 and ka == "SL"):
+            return True
+        if ka == kb:
+            if ka in ["SL", "OTHER", "INTEGER"]:
+                return True
+            if ka in ["SLV", "SIGNED", "UNSIGNED"]:
+                return self.width == other.width
+        return False
+
+    def __repr__(self):
+        return f"PortType({self.text!r})"
+
+_interned = weakref.WeakValueDictionary()
+
+# Distinct raw spellings kept hot; interned descriptors live as long as a
+# port still references them.
+PORT_TYPE_CACHE = 1024
+
+@lru_cache(maxsize=PORT_TYPE_CACHE)
+def port_type(v):
+    n = " ".join(v.lower().split())
+    t = _interned.get(n)
+    if t is None:
+        t = PortType(n)
+        _interned[n] = t
+    return t
+
+def extract_kind(v):
+    return port_type(v).kind
+
 def extract_width(v):
-    m = re.search(r"\((\d+)\s*(?:downto|to|:)\s*(\d+)\)", v, re.IGNORECASE)
-    if m:
-        try:
-            u = int(m.group(1))
-            l = int(m.group(2))
-            return abs(u - l) + 1
-        except:
-            return None
-    if "std_logic" in v.lower() and "vector" not in v.lower():
-        return 1
-    return None
+    return port_type(v).width
 
 def check_dir(d1, d2):
     if d1 == "out" and d2 in ["in", "inout"]:
@@ -39,6 +93,9 @@ def check_dir(d1, d2):
     return False
 
 def types_compatible(a, b):
+    # Takes PortType descriptors, or {"kind", "width"} dicts.
+    if isinstance(a, PortType) and isinstance(b, PortType):
+        return a.compatible(b)
     ka = a["kind"].lower()
     kb = b["kind"].lower()
     # Allow connection between a 1-bit vector and a scalar std_logic.
@@ -52,3 +109,45 @@ def types_compatible(a, b):
         if ka == "integer":
             return True
     return False
+
+def atomic_write(path, data):
+    # Writes bytes to a temp file next to path and renames it over path,
+    # so readers never see a half-written file.
+    d = os.path.dirname(path) or "."
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        um = os.umask(0)
+        os.umask(um)
+        mode = 0o666 & ~um
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=d)
+    try:
+        os.chmod(tmp, mode)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def write_if_changed(path, text):
+    # Atomically replaces path with text unless it already holds exactly
+    # that content (size, then sha1). Returns True if the file was written.
+    data = text.replace("\n", os.linesep).encode("utf-8")
+    try:
+        if os.path.getsize(path) == len(data):
+            h = hashlib.sha1()
+            with open(path, "rb") as f:
+                for ch in iter(lambda: f.read(1 << 20), b""):
+                    h.update(ch)
+            if h.digest() == hashlib.sha1(data).digest():
+                return False
+    except OSError:
+        pass
+    atomic_write(path, data)
+    return True
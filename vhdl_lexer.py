@@ -0,0 +1,430 @@
+#vhdl_lexer.py
+import os
+import re
+import mmap
+import hashlib
+
+# Leading whitespace and comments are folded into each match, so every match
+# is one significant token. A quote right after a name or ")" is an attribute
+# tick (clk'event, t'(...)), not the start of a character literal.
+_TOKEN = re.compile(r"""
+    (?:\s+|--[^\n]*)*
+    (?:
+        (?P<id>[A-Za-z]\w*|\\[^\\\n]*\\)
+      | (?P<num>\d[\w.#]*)
+      | (?P<str>"(?:[^"\n]|"")*")
+      | (?P<chr>(?<![\w)])'[^\n]')
+      | (?P<op>:=|=>|<=|>=|/=|\*\*|\S)
+    )
+""", re.VERBOSE)
+
+_COMMENT = re.compile(r'--[^\n]*')
+_COMMENT_STR = re.compile(r'("(?:[^"\n]|"")*")|--[^\n]*')
+_DASH_STR = re.compile(r'"[^"\n]*--')
+# Literals that hide a paren or semicolon; headers containing one are split
+# token by token instead of with str.find.
+_TRICKY = re.compile(r"""'[();]'|"[^"\n]*[();][^"\n]*\"""")
+_PLAIN_EL = re.compile(r"([^;()]*(?:\([^;()]*\)[^;()]*)*)([;)])")
+_LIST = re.compile(r'[();]|"(?:[^"\n]|"")*"|(?<![\w)])\'[^\n]\'')
+_PORT_EL = re.compile(
+    r"\s*(?:(?:signal|constant|variable|file)\s+)?(\w+(?:\s*,\s*\w+)*)\s*:(?!=)"
+    r"\s*(?:(in|out|inout|buffer|linkage)\b)?\s*(.*)",
+    re.IGNORECASE | re.DOTALL)
+_GEN_EL = re.compile(
+    r"\s*(?:constant\s+)?(\w+(?:\s*,\s*\w+)*)\s*:(?!=)"
+    r"\s*(.*)",
+    re.IGNORECASE | re.DOTALL)
+
+PORT_MODES = ("in", "out", "inout")
+
+# Returned by HeaderParser when the header text ran out before its "end ...;".
+MORE = "more"
+
+def tokens(t, pos=0):
+    # Yields (kind, text, start, end); whitespace and comments are dropped.
+    for m in _TOKEN.finditer(t, pos):
+        k = m.lastgroup
+        yield (k, m.group(k), m.start(k), m.end())
+
+def strip_comments(s):
+    if "--" not in s:
+        return s
+    if '"' in s and _DASH_STR.search(s):
+        return _COMMENT_STR.sub(lambda m: m.group(1) or "", s)
+    return _COMMENT.sub("", s)
+
+class HeaderParser:
+    # Recursive-descent parser for a single entity/component header. h is the
+    # header text from the keyword to a candidate "end ...;", comments removed.
+    def __init__(self, h):
+        self.h = h
+        self.it = None
+        self.cur = None
+        self.plain = _TRICKY.search(h) is None
+
+    def advance(self):
+        self.cur = next(self.it, None)
+
+    def is_kw(self, w):
+        return self.cur is not None and self.cur[0] == "id" and self.cur[1].lower() == w
+
+    def is_op(self, v):
+        return self.cur is not None and self.cur[0] == "op" and self.cur[1] == v
+
+    def resume(self, pos):
+        self.it = tokens(self.h, pos)
+        self.advance()
+
+    def declaration(self):
+        self.resume(0)
+        kw = self.cur[1].lower()
+        self.advance()
+        if self.cur is None:
+            return MORE
+        if self.cur[0] != "id":
+            return None
+        name = self.cur[1]
+        self.advance()
+        if self.is_kw("is"):
+            self.advance()
+        elif kw == "entity":
+            return None if self.cur is not None else MORE
+        gens = []
+        ports = []
+        while self.cur is not None:
+            if self.is_kw("generic") or self.is_kw("port"):
+                is_port = self.is_kw("port")
+                self.advance()
+                if self.cur is None:
+                    return MORE
+                if not self.is_op("("):
+                    return None
+                els = self.interface_list(self.cur[3])
+                if els is None:
+                    return MORE
+                if self.is_op(";"):
+                    self.advance()
+                el_fn = port_element if is_port else generic_element
+                for el in els:
+                    (ports if is_port else gens).extend(el_fn(el))
+            elif self.is_kw("end"):
+                self.advance()
+                if self.is_kw(kw):
+                    self.advance()
+                if self.cur is not None and self.cur[0] == "id" and self.cur[1].lower() == name.lower():
+                    self.advance()
+                if not self.is_op(";"):
+                    return None
+                return kw, (name, gens, ports)
+            else:
+                self.advance()
+        return MORE
+
+    def interface_list(self, pos):
+        # pos is just past the opening "(": return the elements separated by
+        # top-level ";" up to the matching ")" and resume tokenizing after it.
+        r = self.split_plain(pos) if self.plain else self.split_tokens(pos)
+        if r is None:
+            return None
+        els, pos = r
+        self.resume(pos)
+        return [e for e in els if e and not e.isspace()]
+
+    def split_plain(self, pos):
+        # No literal hides a paren or ";": elements with at most one level of
+        # parentheses are cut with a single match each.
+        h = self.h
+        els = []
+        while True:
+            m = _PLAIN_EL.match(h, pos)
+            if m is None:
+                r = self.split_tokens(pos, True)
+                if r is None:
+                    return None
+                el, end, pos = r
+            else:
+                el, end = m.groups()
+                pos = m.end()
+            els.append(el)
+            if end == ")":
+                return els, pos
+
+    def split_tokens(self, pos, one=False):
+        h = self.h
+        els = []
+        depth = 0
+        st = pos
+        for m in _LIST.finditer(h, pos):
+            v = m.group()
+            if v == "(":
+                depth += 1
+            elif v == ")" or v == ";":
+                if depth == 0:
+                    els.append(h[st:m.start()])
+                    if one:
+                        return els[0], v, m.end()
+                    if v == ")":
+                        return els, m.end()
+                    st = m.end()
+                elif v == ")":
+                    depth -= 1
+        return None
+
+def flat(s):
+    if "\n" in s or "\r" in s:
+        return s.replace("\n", " ").replace("\r", " ")
+    return s
+
+def split_names(s):
+    if "," not in s:
+        return (s,)
+    return [n.strip() for n in s.split(",")]
+
+def port_element(el):
+    m = _PORT_EL.match(el)
+    if m is None:
+        return ()
+    ns, dr, tp = m.groups()
+    tp = tp.rstrip()
+    if not tp:
+        return ()
+    dr = dr.lower() if dr else "in"
+    if dr not in PORT_MODES:
+        return ()
+    tp = flat(tp)
+    return [{"name": n, "dir": dr, "type": tp} for n in split_names(ns)]
+
+def generic_element(el):
+    m = _GEN_EL.match(el)
+    if m is None:
+        return ()
+    ns, rest = m.groups()
+    tp, _, d = rest.partition(":=")
+    tp = tp.strip()
+    d = d.strip()
+    if not tp:
+        return ()
+    tp = flat(tp)
+    d = flat(d) if d else None
+    return [{"name": n, "type": tp, "default": d} for n in split_names(ns)]
+
+# Only this many bytes of a source are lowercased and searched at a time.
+WINDOW = 1 << 20
+
+_HEAD = re.compile(rb"(entity|component)\s+(\w+)(\s+is\b)?", re.IGNORECASE)
+_ARCH = re.compile(rb"architecture\s+\w+\s+of\s+\w+\s+is\b", re.IGNORECASE)
+_END_B = re.compile(rb"\bend\b[^;]*;", re.IGNORECASE)
+_INTERFACE = re.compile(rb"\b(port|generic)\s*\(", re.IGNORECASE)
+
+# Keywords looked for in each scan state. Inside an architecture statement
+# part only declarations that start a line are considered, so instantiations
+# ("u0 : entity work.x") never reach the header parser.
+TOP_WORDS = (b"entity", b"component", b"architecture")
+ARCH_WORDS = (b"component", b"begin")
+BODY_WORDS = (b"entity", b"architecture", b"package", b"configuration", b"component")
+
+def is_word_byte(c):
+    return c == 95 or 48 <= c <= 57 or 65 <= c <= 90 or 97 <= c <= 122
+
+class SourceScanner:
+    # Finds entity/component headers in a bytes-like buffer (an mmap for
+    # files). Keyword search runs on lowercased WINDOW-sized copies and only
+    # header spans are decoded, so architecture bodies are never turned into
+    # Python strings and comments are stripped per header, not per file.
+    def __init__(self, buf):
+        self.buf = buf
+        self.n = len(buf)
+        self.ws = -1
+        self.win = b""
+        self.hits = {}
+
+    def window(self, pos):
+        if self.ws < 0 or not (self.ws <= pos < self.ws + WINDOW):
+            self.ws = pos
+            self.win = self.buf[pos:pos + WINDOW + 16].lower()
+            self.hits = {}
+        return self.win
+
+    def find_word(self, words, pos, line_start=False):
+        while pos < self.n:
+            w = self.window(pos)
+            ws = self.ws
+            lim = min(len(w), WINDOW)
+            best = -1
+            bw = None
+            for k in words:
+                c = self.hits.get(k)
+                if c is None or c[0] > pos or (c[1] != -1 and c[1] < pos):
+                    i = w.find(k, pos - ws)
+                    c = (pos, i + ws if 0 <= i < lim else -1)
+                    self.hits[k] = c
+                if c[1] != -1 and (best == -1 or c[1] < best):
+                    best = c[1]
+                    bw = k
+            if best == -1:
+                pos = ws + lim
+                continue
+            pos = best + len(bw)
+            i = best - ws
+            if i > 0:
+                before = w[i-1]
+            elif best > 0:
+                before = self.buf[best-1]
+            else:
+                before = 32
+            if is_word_byte(before) or (i + len(bw) < len(w) and is_word_byte(w[i + len(bw)])):
+                continue
+            if line_start:
+                ls = w.rfind(b"\n", 0, i) + 1 if i > 0 else i
+                if w[ls:i].strip():
+                    continue
+            if self.in_comment_or_string(best):
+                continue
+            return best, bw.decode()
+        return -1, None
+
+    def in_comment_or_string(self, pos):
+        ls = self.buf.rfind(b"\n", 0, pos) + 1
+        seg = self.buf[ls:pos]
+        if seg.count(b'"') % 2:
+            return True
+        i = seg.find(b"--")
+        while i != -1:
+            if seg.count(b'"', 0, i) % 2 == 0:
+                return True
+            i = seg.find(b"--", i+2)
+        return False
+
+    def after_end(self, st):
+        # "end entity x;" / "end component x;" are closers, not headers.
+        p = self.buf[max(0, st-32):st].rstrip()
+        return p[-3:].lower() == b"end" and (len(p) == 3 or not is_word_byte(p[-4]))
+
+    def head(self, st):
+        m = _HEAD.match(self.buf, st)
+        if m is None or (m.group(1).lower() == b"entity" and not m.group(3)):
+            return None
+        if self.after_end(st):
+            return None
+        return m
+
+    def header(self, st):
+        # Grow the header span one "end ...;" at a time until it parses; an
+        # "end" inside a comment only costs one extra attempt.
+        m = self.head(st)
+        if m is None:
+            return None
+        e = m.end()
+        while True:
+            m = _END_B.search(self.buf, e)
+            if not m:
+                return None
+            h = self.buf[st:m.end()].decode("utf-8", "replace")
+            r = HeaderParser(strip_comments(h)).declaration()
+            if r is None:
+                return None
+            if r is not MORE:
+                return r[0], r[1], m.end()
+            e = m.end()
+
+    def locate(self, st):
+        # Name-only counterpart of header(): no tokenizing, only the header
+        # extent and whether it declares any generic or port list.
+        m = self.head(st)
+        if m is None:
+            return None
+        kind = m.group(1).lower().decode()
+        name = m.group(2).decode()
+        e = m.end()
+        while True:
+            me = _END_B.search(self.buf, e)
+            if not me:
+                return None
+            if not self.in_comment_or_string(me.start()):
+                break
+            e = me.end()
+        # Component generics are never reported, so only a port list counts.
+        lists = (b"port",) if kind == "component" else (b"port", b"generic")
+        empty = True
+        p = m.end()
+        while empty:
+            mi = _INTERFACE.search(self.buf, p, me.start())
+            if mi is None:
+                break
+            if not self.in_comment_or_string(mi.start()):
+                empty = mi.group(1).lower() not in lists
+            p = mi.end()
+        return kind, (name, st, empty), me.end()
+
+    def scan(self, index=False):
+        # Returns (entities, components): full (name, generics, ports)
+        # declarations, or (name, offset, empty) references with index=True.
+        ents = []
+        comps = []
+        pos = 0
+        words = TOP_WORDS
+        find = self.locate if index else self.header
+        while True:
+            st, k = self.find_word(words, pos, words is BODY_WORDS)
+            if st < 0:
+                break
+            pos = st + len(k)
+            if k == "begin":
+                words = BODY_WORDS
+                continue
+            if k == "architecture":
+                if _ARCH.match(self.buf, st):
+                    words = ARCH_WORDS
+                continue
+            if words is BODY_WORDS and k != "component":
+                words = TOP_WORDS
+            r = find(st)
+            if r is None:
+                continue
+            kind, decl, pos = r
+            if kind == "entity":
+                ents.append(decl)
+            else:
+                comps.append(decl)
+        return ents, comps
+
+def parse_declarations(t):
+    if isinstance(t, str):
+        t = t.encode("utf-8")
+    return SourceScanner(t).scan()
+
+def stamped(f, buf, fn):
+    # (fn(buf), (mtime_ns, size, sha1)) for the bytes fn saw; the stamp is
+    # None if the file changed while it was being read.
+    st = os.fstat(f.fileno())
+    r = fn(buf)
+    dg = hashlib.sha1(buf).hexdigest()
+    st2 = os.fstat(f.fileno())
+    if (st.st_mtime_ns, st.st_size) != (st2.st_mtime_ns, st2.st_size):
+        return r, None
+    return r, (st.st_mtime_ns, st.st_size, dg)
+
+def map_path(pa, fn, stamp=False):
+    # Runs fn(buf) over the memory-mapped file; an empty or unmappable file
+    # falls back to a plain read. With stamp, see stamped().
+    with open(pa, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mm = None
+        buf = f.read() if mm is None else mm
+        try:
+            return stamped(f, buf, fn) if stamp else fn(buf)
+        finally:
+            if mm is not None:
+                mm.close()
+
+def scan_path(pa):
+    return map_path(pa, lambda b: SourceScanner(b).scan())
+
+def index_path(pa, stamp=False):
+    return map_path(pa, lambda b: SourceScanner(b).scan(True), stamp)
+
+def header_at(pa, offset):
+    # Parses the single header an index_path() reference points at.
+    return map_path(pa, lambda b: SourceScanner(b).header(offset))
@@ -2,157 +2,171 @@
 import os
 import re
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from parse_cache import ParseCache, file_stamp
+from block_registry import BlockRegistry
+from vhdl_lexer import parse_declarations, scan_path, index_path, header_at
 
-def preprocess_vhdl(t):
-    lines = t.split('\n')
-    r = []
-    for l in lines:
-        i = l.find('--')
-        if i != -1:
-            l = l[:i]
-        r.append(l)
-    return '\n'.join(r)
-
-def extract_ports(b):
-    b = b.strip().replace('\n',' ').replace('\r',' ')
-    if not b.endswith(';'):
-        b += ';'
-    items = re.split(r';', b)
-    ports = []
-    for it in items:
-        it = it.strip()
-        if not it:
-            continue
-        m = re.match(r"([\w\d_]+)\s*:\s*(in|out|inout)\s+(.+)$", it, re.IGNORECASE)
-        if m:
-            nm = m.group(1).strip()
-            dr = m.group(2).lower().strip()
-            tp = m.group(3).strip().rstrip(',')
-            ports.append({"name":nm,"dir":dr,"type":tp})
-    return ports
-
-def extract_generics(b):
-    b = b.strip().replace('\n',' ').replace('\r',' ')
-    if not b.endswith(';'):
-        b += ';'
-    items = re.split(r';', b)
-    gens = []
-    for it in items:
-        it = it.strip()
-        if not it:
-            continue
-        m = re.match(r"([\w\d_]+)\s*:\s*(\w+)\s*(?::=\s*([^;]+))?$", it, re.IGNORECASE)
-        if m:
-            nm = m.group(1).strip()
-            tp = m.group(2).strip()
-            d  = m.group(3).strip() if m.group(3) else None
-            gens.append({"name":nm,"type":tp,"default":d})
-    return gens
+# Bump whenever scan_file output changes so stale .vsb_cache entries are dropped.
+SCAN_VERSION = 4
 
 def parse_vhdl_for_entities(t):
-    txt = preprocess_vhdl(t)
-    p = r"entity\s+([\w\d_]+)\s+is\s+(.*?)end\s+\1\s*;"
-    found = re.findall(p, txt, flags=re.DOTALL|re.IGNORECASE)
-    out = []
-    for en, bd in found:
-        gp = re.search(r"generic\s*\(\s*(.*?)\s*\)\s*;", bd, flags=re.DOTALL|re.IGNORECASE)
-        gs = []
-        if gp:
-            gs = extract_generics(gp.group(1))
-        pp = re.search(r"port\s*\(\s*(.*)\s*\)\s*;", bd, flags=re.DOTALL|re.IGNORECASE)
-        ps = []
-        if pp:
-            ps = extract_ports(pp.group(1))
-        out.append((en, gs, ps))
-    return out
+    return parse_declarations(t)[0]
 
 def parse_vhdl_for_components(t):
-    txt = preprocess_vhdl(t)
-    p = r"COMPONENT\s+([\w\d_]+)\s+is\s+(.*?)END\s+COMPONENT(?:\s+\1)?\s*;"
-    found = re.findall(p, txt, flags=re.DOTALL|re.IGNORECASE)
-    out = []
-    for cn, bd in found:
-        pm_port = re.search(r"PORT\s*\(\s*(.*)\s*\)\s*;", bd, flags=re.DOTALL|re.IGNORECASE)
-        ports = []
-        if pm_port:
-            ports = extract_ports(pm_port.group(1))
-        out.append((cn, [], ports))
-    return out
+    # Component generics are not reported: instances of a bare component
+    # (e.g. an Efinix _tmpl.vhd) keep their defaults.
+    return [(cn, [], ps) for cn, _, ps in parse_declarations(t)[1]]
 
 def scan_file(pa):
-    with open(pa, "r") as ff:
-        c = ff.read()
-    e = parse_vhdl_for_entities(c)
-    co = parse_vhdl_for_components(c)
-    return e, co
+    e, co = scan_path(pa)
+    return e, [(cn, [], ps) for cn, _, ps in co]
 
-def find_blocks(d):
-    bd = {}
-    if not os.path.isdir(d):
-        return []
-    for fn in os.listdir(d):
-        lf = fn.lower()
-        if (lf.endswith(".vhd") or lf.endswith(".vhdl")) and \
-           not lf.startswith("tb_") and \
-           not lf.endswith("_tb.vhd") and \
-           not lf.endswith("_tb.vhdl") and \
-           not lf.endswith("topleveladapter.vhd"):
-            fp = os.path.join(d, fn)
-            pe, pc = scan_file(fp)
-            for name, g, p in pe:
-                if name in bd:
-                    eg = bd[name][1]
-                    ep = bd[name][2]
-                    for gg in g:
-                        if not any(x['name'] == gg['name'] for x in eg):
-                            eg.append(gg)
-                    for pp in p:
-                        if not any(x['name'] == pp['name'] for x in ep):
-                            ep.append(pp)
-                else:
-                    bd[name] = (name, g.copy(), p.copy())
-            for name, g, p in pc:
-                if name in bd:
-                    eg = bd[name][1]
-                    ep = bd[name][2]
-                    for pp in p:
-                        if not any(x['name'] == pp['name'] for x in ep):
-                            ep.append(pp)
-                else:
-                    bd[name] = (name, g.copy(), p.copy())
+def index_file(pa):
+    # Name-only pass: (name, byte offset, empty) per entity and component.
+    return index_path(pa)
+
+def try_index_file(pa):
+    # (index_file result, stamp for the cache), or None if the file cannot
+    # be read (it may have gone since it was listed); one such file must not
+    # fail a whole batch.
+    try:
+        return index_path(pa, True)
+    except OSError:
+        return None
+
+def parse_block_at(pa, offset, kind, name):
+    # Full parse of one indexed declaration. If the file moved under the
+    # index (offset no longer points at that block) the whole file is
+    # rescanned instead.
+    r = None
+    try:
+        r = header_at(pa, offset)
+    except (OSError, ValueError):
+        pass
+    if r is None or r[0] != kind or r[1][0] != name:
+        try:
+            ents, comps = scan_file(pa)
+        except OSError:
+            return [], []
+        for n, g, p in (ents if kind == "entity" else comps):
+            if n == name:
+                return g, p
+        return [], []
+    _, (_, g, p), _ = r
+    return (g if kind == "entity" else []), p
+
+def is_vhdl_source(fn, top=False):
+    lf = fn.lower()
+    if not (lf.endswith(".vhd") or lf.endswith(".vhdl")):
+        return False
+    if lf.startswith("tb_") or lf.endswith("_tb.vhd") or lf.endswith("_tb.vhdl"):
+        return False
+    if top and lf.endswith("topleveladapter.vhd"):
+        return False
+    return True
+
+def list_vhdl_files(d):
+    # Project root first, then the ip/ tree, each in sorted path order so the
+    # merge in find_blocks does not depend on directory listing order.
+    out = []
+    for fn in sorted(os.listdir(d)):
+        fp = os.path.join(d, fn)
+        if is_vhdl_source(fn, True) and os.path.isfile(fp):
+            out.append(fp)
     ipd = os.path.join(d, "ip")
     if os.path.isdir(ipd):
         for root, dirs, files in os.walk(ipd):
-            for fl in files:
-                lfl = fl.lower()
-                if (lfl.endswith(".vhd") or lfl.endswith(".vhdl")) and \
-                   not lfl.startswith("tb_") and \
-                   not lfl.endswith("_tb.vhd") and \
-                   not lfl.endswith("_tb.vhdl"):
-                    fp = os.path.join(root, fl)
-                    pe, pc = scan_file(fp)
-                    for name, g, p in pe:
-                        if name in bd:
-                            eg = bd[name][1]
-                            ep = bd[name][2]
-                            for gg in g:
-                                if not any(x['name'] == gg['name'] for x in eg):
-                                    eg.append(gg)
-                            for pp in p:
-                                if not any(x['name'] == pp['name'] for x in ep):
-                                    ep.append(pp)
-                        else:
-                            bd[name] = (name, g.copy(), p.copy())
-                    for name, g, p in pc:
-                        if name in bd:
-                            eg = bd[name][1]
-                            ep = bd[name][2]
-                            for pp in p:
-                                if not any(x['name'] == pp['name'] for x in ep):
-                                    ep.append(pp)
-                        else:
-                            bd[name] = (name, g.copy(), p.copy())
-    return list(bd.values())
+            dirs.sort()
+            for fl in sorted(files):
+                if is_vhdl_source(fl):
+                    out.append(os.path.join(root, fl))
+    return out
+
+def vhdl_sort_key(d):
+    # Orders paths the way list_vhdl_files visits them.
+    ipd = os.path.join(d, "ip")
+    def key(p):
+        rel = os.path.relpath(p, ipd)
+        if rel.startswith(os.pardir):
+            return (0, (), os.path.basename(p))
+        parts = rel.split(os.sep)
+        return (1, tuple(parts[:-1]), parts[-1])
+    return key
+
+# Below this many uncached files a process pool costs more than it saves.
+PARALLEL_MIN_FILES = 8
+
+def scan_files(paths, cache=None, workers=None):
+    # Per path (entities, components), or None if it could not be read.
+    res = [None]*len(paths)
+    todo = []
+    for i, fp in enumerate(paths):
+        r = cache.get(fp) if cache is not None else None
+        if r is not None:
+            res[i] = ([tuple(x) for x in r[0]], [tuple(x) for x in r[1]])
+        else:
+            todo.append(i)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(todo))
+    done = None
+    if workers > 1 and len(todo) >= PARALLEL_MIN_FILES:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                cs = max(1, len(todo)//(workers*4))
+                done = list(ex.map(try_index_file, [paths[i] for i in todo], chunksize=cs))
+        except (OSError, BrokenProcessPool, NotImplementedError):
+            # No pool here (or it died): read the files in this process.
+            done = None
+    if done is None:
+        done = [try_index_file(paths[i]) for i in todo]
+    for i, rs in zip(todo, done):
+        if rs is None:
+            continue
+        r, st = rs
+        res[i] = r
+        if cache is not None:
+            cache.put(paths[i], [r[0], r[1]], st)
+    return res
+
+def build_registry(d, use_cache=True, workers=None):
+    reg = BlockRegistry(vhdl_sort_key(d), parse_block_at)
+    if not os.path.isdir(d):
+        return reg
+    cache = ParseCache(d, "scan", SCAN_VERSION) if use_cache else None
+    paths = list_vhdl_files(d)
+    for fp, r in zip(paths, scan_files(paths, cache, workers)):
+        if r is not None:
+            reg.add_file(fp, r[0], r[1])
+    if cache is not None:
+        cache.evict_unseen()
+        cache.save()
+    return reg
+
+def update_registry(d, reg, paths, removed, use_cache=True):
+    # Re-scans only the given files; returns the affected block names.
+    cache = ParseCache(d, "scan", SCAN_VERSION) if use_cache else None
+    names = set()
+    removed = list(removed)
+    for fp in paths:
+        r = scan_files([fp], cache, 1)[0]
+        if r is None:
+            removed.append(fp)
+            continue
+        names |= reg.update_file(fp, r[0], r[1])
+    for fp in removed:
+        names |= reg.remove_file(fp)
+        if cache is not None:
+            cache.drop(fp)
+    if cache is not None:
+        cache.save()
+    return names
+
+def find_blocks(d, use_cache=True, workers=None):
+    # Parses every block; the GUI keeps the registry and loads on demand.
+    return build_registry(d, use_cache, workers).as_list()
 
 def parse_gpio_name(name):
     m = re.match(r"(.*)\[(\d+)\]$", name)
@@ -168,97 +182,107 @@ def produce_port_entry(base_name, idx_list, direction):
         lo = min(idx_list)
         return {"name": base_name, "dir": direction, "type": f"std_logic_vector({hi} downto {lo})"}
 
-def parse_peri_xml(d):
-    path = os.path.join(d, "DIspx.peri.xml")
-    if not os.path.exists(path):
-        return [], []
-    tree = ET.parse(path)
-    root = tree.getroot()
-    ns = {'efxpt': 'http://www.efinixinc.com/peri_design_db'}
+PERI_NS = "{http://www.efinixinc.com/peri_design_db}"
+PERI_VERSION = 1
 
-    gps = root.findall('.//efxpt:gpio', ns)
-    input_bus_map = {}
-    output_bus_map = {}
-    inout_individual = []
-
-    for gp in gps:
-        n = gp.get('name','')
-        m = gp.get('mode','').lower()
-        if m == 'inout':
-            read_base, read_idx = parse_gpio_name(n+"_read")
-            write_base, write_idx = parse_gpio_name(n+"_write")
-            en_base, en_idx = parse_gpio_name(n+"_writeEnable")
-            inout_individual.append({"name": read_base, "idx": read_idx, "dir": "in"})
-            inout_individual.append({"name": write_base, "idx": write_idx, "dir": "out"})
-            inout_individual.append({"name": en_base, "idx": en_idx, "dir": "out"})
-        else:
-            base, idx = parse_gpio_name(n)
-            if m == 'input':
-                bus_map = input_bus_map
-                direct = 'in'
-            else:
-                bus_map = output_bus_map
-                direct = 'out'
-            if base not in bus_map:
-                bus_map[base] = {"dir": direct, "idx_set": set()}
-            bus_map[base]["idx_set"].add(idx if idx is not None else -1)
-
-    in_list = []
-    out_list = []
-
-    for k,info in input_bus_map.items():
-        direct = info["dir"]
-        idxs = sorted([x for x in info["idx_set"]])
-        if idxs == [-1]:
-            in_list.append({"name": k,"dir": direct,"type":"std_logic"})
-        else:
-            hi = max(idxs)
-            lo = min(idxs)
-            if hi == lo:
-                in_list.append({"name": k,"dir": direct,"type":"std_logic"})
-            else:
-                in_list.append({
-                    "name": k,
-                    "dir": direct,
-                    "type": f"std_logic_vector({hi} downto {lo})"
-                })
+def find_peri_xml(d):
+    # DIspx.peri.xml is the Efinity default; otherwise the first *.peri.xml.
+    path = os.path.join(d, "DIspx.peri.xml")
+    if os.path.isfile(path):
+        return path
+    try:
+        names = sorted(fn for fn in os.listdir(d) if fn.lower().endswith(".peri.xml"))
+    except OSError:
+        return None
+    for fn in names:
+        if os.path.isfile(os.path.join(d, fn)):
+            return os.path.join(d, fn)
+    return None
 
-    for k,info in output_bus_map.items():
+def bus_ports(bus_map):
+    out = []
+    for k,info in bus_map.items():
         direct = info["dir"]
-        idxs = sorted([x for x in info["idx_set"]])
-        if idxs == [-1]:
-            out_list.append({"name": k,"dir": direct,"type":"std_logic"})
+        idxs = info["idx_set"]
+        hi = max(idxs)
+        lo = min(idxs)
+        if hi == lo:
+            out.append({"name": k,"dir": direct,"type":"std_logic"})
         else:
-            hi = max(idxs)
-            lo = min(idxs)
-            if hi == lo:
-                out_list.append({"name": k,"dir": direct,"type":"std_logic"})
-            else:
-                out_list.append({
-                    "name": k,
-                    "dir": direct,
-                    "type": f"std_logic_vector({hi} downto {lo})"
-                })
+            out.append({
+                "name": k,
+                "dir": direct,
+                "type": f"std_logic_vector({hi} downto {lo})"
+            })
+    return out
 
+def scan_peri_xml(path):
+    # Single streaming pass; elements are cleared and detached from their
+    # parent once closed, so memory stays flat on pin-heavy designs.
+    input_bus_map = {}
+    output_bus_map = {}
     inout_in = []
     inout_out = []
-    for x in inout_individual:
-        if x["dir"] == "in":
-            inout_in.append({"name": x["name"], "dir":"in","type":"std_logic"})
-        else:
-            inout_out.append({"name": x["name"], "dir":"out","type":"std_logic"})
-
-    board_in = in_list + inout_in
-    board_out = out_list + inout_out
-
-    # Parse PLL outputs as additional "inputs" to the core.
-    pll_list = root.findall('.//efxpt:pll', ns)
-    for pll in pll_list:
-        outs = pll.findall('.//efxpt:output_clock', ns)
-        for oc in outs:
-            clk_name = oc.get('name','')
-            # We'll treat these PLL outputs as additional "inputs" from the board's perspective
-            if clk_name:
-                board_in.append({"name": clk_name, "dir":"in", "type":"std_logic"})
-
+    pll_clocks = []
+    stack = []
+    in_pll = 0
+    for ev, el in ET.iterparse(path, events=("start", "end")):
+        tag = el.tag
+        if ev == "start":
+            stack.append(el)
+            if tag == PERI_NS + "pll":
+                in_pll += 1
+            elif tag == PERI_NS + "gpio":
+                n = el.get('name','')
+                m = el.get('mode','').lower()
+                if m == 'inout':
+                    inout_in.append({"name": parse_gpio_name(n+"_read")[0], "dir":"in","type":"std_logic"})
+                    inout_out.append({"name": parse_gpio_name(n+"_write")[0], "dir":"out","type":"std_logic"})
+                    inout_out.append({"name": parse_gpio_name(n+"_writeEnable")[0], "dir":"out","type":"std_logic"})
+                else:
+                    base, idx = parse_gpio_name(n)
+                    if m == 'input':
+                        bus_map = input_bus_map
+                        direct = 'in'
+                    else:
+                        bus_map = output_bus_map
+                        direct = 'out'
+                    if base not in bus_map:
+                        bus_map[base] = {"dir": direct, "idx_set": set()}
+                    bus_map[base]["idx_set"].add(idx if idx is not None else -1)
+            elif tag == PERI_NS + "output_clock" and in_pll:
+                # PLL outputs are additional "inputs" from the board's perspective.
+                clk_name = el.get('name','')
+                if clk_name:
+                    pll_clocks.append({"name": clk_name, "dir":"in", "type":"std_logic"})
+            continue
+        if tag == PERI_NS + "pll":
+            in_pll -= 1
+        stack.pop()
+        el.clear()
+        if stack and len(stack[-1]) and stack[-1][-1] is el:
+            del stack[-1][-1]
+    board_in = bus_ports(input_bus_map) + inout_in + pll_clocks
+    board_out = bus_ports(output_bus_map) + inout_out
     return board_in, board_out
+
+def parse_peri_xml(d, path=None, use_cache=True):
+    # Board-side ports from the Efinity interface design (*.peri.xml). The
+    # result is cached under .vsb_cache/ keyed by the file's fingerprint.
+    if path is None:
+        path = find_peri_xml(d)
+    if path is None or not os.path.isfile(path):
+        return [], []
+    cache = ParseCache(d, "peri", PERI_VERSION) if use_cache else None
+    r = cache.get(path) if cache is not None else None
+    if r is None:
+        # Stamped before parsing: a save during the parse leaves an entry
+        # whose sha1 no longer matches, not a stale result under new stamps.
+        st = file_stamp(path) if cache is not None else None
+        r = scan_peri_xml(path)
+        if cache is not None:
+            cache.put(path, [r[0], r[1]], st)
+    if cache is not None:
+        cache.evict_unseen()
+        cache.save()
+    return r[0], r[1]
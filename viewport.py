@@ -0,0 +1,164 @@
+#viewport.py
+
+# Zoom and level of detail. Model coordinates (block.x, port.x, Main.json)
+# never change: the canvas shows them at model * zoom + offset, kept in
+# canvas.data["view"], and zooming is a single canvas.scale. Below
+# DETAIL_ZOOM port labels are hidden and wires drawn straight. Wires that
+# are off screen are not re-routed until they come into view.
+from router import OrthogonalRouter
+
+ZOOM_MIN = 0.1
+ZOOM_MAX = 4.0
+ZOOM_STEP = 1.15
+DETAIL_ZOOM = 0.6
+
+def view(canvas):
+    return canvas.data.get("view", (1.0, 0.0, 0.0))
+
+def to_view(canvas, x, y):
+    z, ox, oy = view(canvas)
+    return x * z + ox, y * z + oy
+
+def to_model(canvas, vx, vy):
+    z, ox, oy = view(canvas)
+    return (vx - ox) / z, (vy - oy) / z
+
+def unzoom(canvas, d):
+    # A view distance in model units (left as is at zoom 1, so positions
+    # saved to Main.json keep their integer form).
+    z = view(canvas)[0]
+    return d if z == 1.0 else d / z
+
+def detailed(canvas):
+    return view(canvas)[0] >= DETAIL_ZOOM
+
+def lod(canvas):
+    # Bumped whenever the level of detail flips; a wire drawn at another
+    # level is re-routed when it is next seen.
+    return canvas.data.get("lod", 0)
+
+def place(canvas, tag):
+    # Items of a new block are created at model coordinates; this moves
+    # them into the current view.
+    z, ox, oy = view(canvas)
+    if z != 1.0:
+        canvas.scale(tag, 0, 0, z, z)
+    if ox or oy:
+        canvas.move(tag, ox, oy)
+    if not detailed(canvas):
+        canvas.itemconfig(tag + "&&label", state="hidden")
+
+def show_labels(canvas, tag=None):
+    # Port labels (of one block tag, or all) as the level of detail wants
+    # them; deleted blocks, which are only hidden, stay hidden.
+    expr = "label&&!deleted" if tag is None else tag + "&&label&&!deleted"
+    canvas.itemconfig(expr, state="normal" if detailed(canvas) else "hidden")
+
+def move(canvas, tag, dx, dy):
+    # Moves items by a model-space offset.
+    z = view(canvas)[0]
+    canvas.move(tag, dx * z, dy * z)
+
+def routing(canvas):
+    # "spline" or "orthogonal", chosen per design (Main.json "routing").
+    return canvas.data.get("routing", "spline")
+
+def smooth(canvas):
+    return routing(canvas) != "orthogonal"
+
+def router_of(canvas):
+    r = canvas.data.get("router")
+    if r is None:
+        r = canvas.data["router"] = OrthogonalRouter()
+    return r
+
+def wire_coords(canvas, p1, p2, ln=None):
+    # View coordinates of a wire; orthogonal routes need the line id (its
+    # cached route and lane).
+    if not detailed(canvas):
+        return to_view(canvas, p1.x, p1.y) + to_view(canvas, p2.x, p2.y)
+    if ln is not None and not smooth(canvas):
+        pts = router_of(canvas).route(ln, p1, p2)
+        out = ()
+        for i in range(0, len(pts), 2):
+            out += to_view(canvas, pts[i], pts[i+1])
+        return out
+    sx, sy = to_view(canvas, p1.x, p1.y)
+    ex, ey = to_view(canvas, p2.x, p2.y)
+    cx = sx + (ex - sx) / 2
+    return (sx, sy, cx, sy, cx, ey, ex, ey)
+
+def overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def route(canvas, ln, p1, p2):
+    # Redraws wire ln between ports p1 and p2, unless it was off screen
+    # and still is (then it waits in stale_wires for refresh()).
+    nb = (min(p1.x, p2.x), min(p1.y, p2.y), max(p1.x, p2.x), max(p1.y, p2.y))
+    drawn = canvas.data.setdefault("drawn", {})
+    stale = canvas.data.setdefault("stale_wires", set())
+    vb = canvas.data.get("visible")
+    d = drawn.get(ln)
+    if vb is not None and d is not None and not overlaps(nb, vb) and not overlaps(d[1], vb):
+        stale.add(ln)
+        return
+    canvas.coords(ln, *wire_coords(canvas, p1, p2, ln))
+    drawn[ln] = (lod(canvas), nb)
+    stale.discard(ln)
+
+def forget_wire(canvas, ln):
+    canvas.data.get("drawn", {}).pop(ln, None)
+    canvas.data.get("stale_wires", set()).discard(ln)
+    if "router" in canvas.data:
+        canvas.data["router"].release(ln)
+
+def set_routing(canvas, mode):
+    # Switching redraws the visible wires now, the rest as they come into
+    # view (a spline's control points already form an orthogonal path).
+    if mode == routing(canvas):
+        return
+    canvas.data["routing"] = mode
+    canvas.itemconfig("wire", smooth=smooth(canvas))
+    router_of(canvas).clear()
+    canvas.data["lod"] = lod(canvas) + 1
+    refresh(canvas)
+
+def refresh(canvas):
+    # Brings the wires on screen up to date after a pan or zoom; cost
+    # follows what is visible, not the size of the design.
+    x0, y0 = canvas.canvasx(0), canvas.canvasy(0)
+    x1, y1 = canvas.canvasx(canvas.winfo_width()), canvas.canvasy(canvas.winfo_height())
+    vb = to_model(canvas, x0, y0) + to_model(canvas, x1, y1)
+    canvas.data["visible"] = vb
+    cs = canvas.data["connections"]
+    stale = canvas.data.setdefault("stale_wires", set())
+    for ln in list(stale):
+        c = cs.by_line(ln)
+        if c is None:
+            stale.discard(ln)
+            continue
+        p1, p2 = c[0], c[1]
+        if overlaps((min(p1.x, p2.x), min(p1.y, p2.y), max(p1.x, p2.x), max(p1.y, p2.y)), vb):
+            route(canvas, ln, p1, p2)
+    g = lod(canvas)
+    drawn = canvas.data.setdefault("drawn", {})
+    for i in canvas.find_overlapping(x0, y0, x1, y1):
+        c = cs.by_line(i)
+        # Wires never routed here were drawn at the initial level.
+        if c is not None and drawn.get(i, (0,))[0] != g:
+            route(canvas, i, c[0], c[1])
+
+def zoom(canvas, f, px, py):
+    # Scales the view by f around canvas point (px, py).
+    z, ox, oy = view(canvas)
+    nz = min(ZOOM_MAX, max(ZOOM_MIN, z * f))
+    f = nz / z
+    if f == 1.0:
+        return
+    was = detailed(canvas)
+    canvas.scale("all", px, py, f, f)
+    canvas.data["view"] = (nz, (ox - px) * f + px, (oy - py) * f + py)
+    if detailed(canvas) != was:
+        canvas.data["lod"] = lod(canvas) + 1
+        show_labels(canvas)
+    refresh(canvas)